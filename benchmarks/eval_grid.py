@@ -0,0 +1,74 @@
+"""Compare Pandag.eval_grid with evaluating each variant separately.
+
+The C4 algo is evaluated on its sample frame tiled to about 500k rows, with
+20 values of `c4_target`, with and without a path column.
+
+Usage: python benchmarks/eval_grid.py [repeat]
+"""
+import os
+import sys
+import time
+
+import numpy as np
+import pandas as pd
+
+from pandag import Pandag
+from pandag.graphml import generate_node_id
+
+FILES = os.path.join(os.path.dirname(os.path.abspath(__file__)), os.pardir, 'tests', 'files')
+PARAMS = {
+    'c4_target': 0.9,
+    'outrigger_target': 1.1,
+    'outrigger_min': 1,
+    'num_grace_days': 14,
+}
+PARAM_SETS = {f'c4_target={t:.2f}': {'c4_target': t} for t in np.linspace(0.5, 1.45, 20)}
+ROWS = 500_000
+
+
+def node_id_gen(node, data):
+    node_id, label = generate_node_id(node, data)
+    return int(node_id), label
+
+
+def load(path_column, params):
+    dag = Pandag(path_column=path_column)
+    dag.load_graphml(os.path.join(FILES, 'c4.graphml'), custom_ids=True,
+                     local_dict=params, node_id_func=node_id_gen)
+    return dag
+
+
+def naive(df, path_column):
+    """Reload the graph with each variant's parameters and evaluate it."""
+    return {key: load(path_column, {**PARAMS, **params}).eval(df)
+            for key, params in PARAM_SETS.items()}
+
+
+def grid(df, path_column):
+    return load(path_column, PARAMS).eval_grid(df, PARAM_SETS)
+
+
+def measure(func, df, path_column, repeat):
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        func(df, path_column)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 3
+    df = pd.read_pickle(os.path.join(FILES, 'c4.df.pickle'))
+    df = df[['target_roas_old', 'days_since_last_change']]
+    df = pd.concat([df] * (ROWS // len(df) + 1), ignore_index=True)
+    print(f'{len(df)} rows, {len(PARAM_SETS)} variants')
+    for path_column in ('dag_path', None):
+        times = {func.__name__: measure(func, df, path_column, repeat) for func in (naive, grid)}
+        print(f'path column {path_column!s:10} naive {times["naive"]:6.2f} s  '
+              f'eval_grid {times["grid"]:6.2f} s  '
+              f'speed-up {times["naive"] / times["grid"]:.2f}x')
+
+
+if __name__ == '__main__':
+    main()
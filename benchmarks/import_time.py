@@ -0,0 +1,36 @@
+"""Measure pandag import times in fresh interpreters.
+
+Usage: python benchmarks/import_time.py [repeat]
+"""
+import subprocess
+import sys
+import time
+
+CASES = {
+    'python': 'pass',
+    'import pandas': 'import pandas',
+    'import pandag': 'import pandag',
+    'import pandag.runtime': 'import pandag.runtime',
+    'from pandag import Pandag': 'from pandag import Pandag',
+    'import pandag.plot': 'import pandag.plot',
+}
+
+
+def measure(code, repeat):
+    """Return the best wall time of running `code` in a new interpreter."""
+    best = float('inf')
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.run([sys.executable, '-c', code], check=True)
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main():
+    repeat = int(sys.argv[1]) if len(sys.argv) > 1 else 5
+    for name, code in CASES.items():
+        print(f'{name:30} {measure(code, repeat) * 1000:8.1f} ms')
+
+
+if __name__ == '__main__':
+    main()
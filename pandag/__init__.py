@@ -1,8 +1,15 @@
 """Top-level package for pandag."""
 
-from .pandag import Pandag
-
 __all__ = ['Pandag']
 __author__ = """NAGY, Attila"""
 __email__ = 'nagy.attila@gmail.com'
 __version__ = "0.0.11"
+
+
+def __getattr__(name):
+    # Pandag (and networkx with it) is only imported on first use, so
+    # compiled graphs can be evaluated with pandag.runtime without it
+    if name == 'Pandag':
+        from .pandag import Pandag
+        return Pandag
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,152 @@
+"""Buffered column writes for Output nodes."""
+from collections import ChainMap
+from collections.abc import Mapping
+
+import numpy as np
+import pandas as pd
+
+
+class WriteBuffer(Mapping):
+    """Collect column updates in preallocated arrays.
+
+    A column's array is allocated with its final dtype (from
+    `Pandag.output_schema`) when it's first written, and each update only
+    scatters the values of the selected rows into it. The DataFrame is never
+    modified row by row, its blocks aren't copied or upcast on each Output
+    node, and no full-length values are kept between updates. Columns read
+    from the buffer are Series viewing the arrays, an array is copied before
+    it's written again, so the values read don't change.
+
+    The buffer is a mapping of column name -> current values, so it can be
+    used by `DataFrame.eval` as a resolver (see `resolver`) for expressions
+    reading columns written by upstream nodes.
+    """
+
+    def __init__(self, df, schema):
+        self.df = df
+        self.schema = dict(schema)
+        self.arrays = {}
+        # columns with Series viewing their arrays
+        self.shared = set()
+
+    def record(self, loc, column, value):
+        """Set `column` to `value` on the rows selected by `loc`."""
+        if column not in self.arrays:
+            self.arrays[column] = self._allocate(column)
+        elif column in self.shared:
+            self.arrays[column] = self.arrays[column].copy()
+            self.shared.discard(column)
+        self._scatter(column, loc, value)
+
+    def _allocate(self, column):
+        """Return the initial values of `column`."""
+        dtype = self.schema.setdefault(column, np.dtype(object))
+        exists = column in self.df
+        if isinstance(dtype, pd.CategoricalDtype):
+            if exists:
+                return pd.Categorical(self.df[column], dtype=dtype).codes.copy()
+            codes_dtype = np.min_scalar_type(-len(dtype.categories))
+            return np.full(len(self.df), -1, dtype=codes_dtype)
+        if isinstance(dtype, pd.api.extensions.ExtensionDtype):
+            # nullable extension dtypes (e.g. Int64) are kept
+            if exists:
+                return pd.array(self.df[column], dtype=dtype, copy=True)
+            return pd.array(np.full(len(self.df), None, dtype=object), dtype=dtype)
+        if exists:
+            return self.df[column].to_numpy(dtype=dtype, copy=True)
+        return np.full(len(self.df), np.nan, dtype=dtype)
+
+    def _widen(self, column, dtype):
+        """Convert `column` to `dtype` for values the schema didn't expect."""
+        self.arrays[column] = np.asarray(self._values(column)).astype(dtype)
+        self.schema[column] = dtype
+
+    def _scatter(self, column, loc, value):
+        dtype = self.schema[column]
+        if isinstance(dtype, pd.CategoricalDtype):
+            if isinstance(value, str) and value in dtype.categories:
+                self.arrays[column][loc] = dtype.categories.get_loc(value)
+                return
+            self._widen(column, np.dtype(object))
+        scalar = np.ndim(value) == 0
+        if not scalar:
+            value = np.asarray(value)[loc]
+        array = self.arrays[column]
+        if isinstance(array, pd.api.extensions.ExtensionArray):
+            try:
+                array[loc] = value
+                return
+            except (TypeError, ValueError):
+                self._widen(column, np.dtype(object))
+                array = self.arrays[column]
+        value_dtype = np.min_scalar_type(value) if scalar else value.dtype
+        if not np.can_cast(value_dtype, array.dtype, casting='safe'):
+            if array.dtype.kind in 'biuf' and value_dtype.kind in 'biuf':
+                self._widen(column, np.promote_types(array.dtype, value_dtype))
+            else:
+                self._widen(column, np.dtype(object))
+            array = self.arrays[column]
+        array[loc] = value
+
+    def _values(self, column):
+        array = self.arrays[column]
+        dtype = self.schema[column]
+        if isinstance(dtype, pd.CategoricalDtype):
+            return pd.Categorical.from_codes(array, dtype=dtype)
+        return array
+
+    def __getitem__(self, column):
+        if column not in self.arrays:
+            raise KeyError(column)
+        self.shared.add(column)
+        return pd.Series(self._values(column), index=self.df.index,
+                         name=column, copy=False)
+
+    def __contains__(self, column):
+        # Mapping's default builds the Series
+        return column in self.arrays
+
+    def __iter__(self):
+        return iter(self.arrays)
+
+    def __len__(self):
+        return len(self.arrays)
+
+    def resolver(self, loc=None):
+        """Return a mapping for `DataFrame.eval(resolvers=...)`.
+
+        pandas may store temporaries in the resolvers, those go to a
+        throw-away dict in front of the buffer. If `loc` is given, only the
+        selected rows are returned, for evaluating a subset of the frame."""
+        if loc is None:
+            return ChainMap({}, self)
+        return ChainMap({}, _Rows(self, loc))
+
+    def columns(self):
+        """Return all written columns as Series, in schema order.
+
+        New columns of the schema are returned even if no row was written,
+        filled with missing values, so the result's columns don't depend on
+        the data."""
+        for column in self.schema:
+            if column not in self and column not in self.df:
+                self.arrays[column] = self._allocate(column)
+        order = [c for c in self.schema if c in self] + [c for c in self if c not in self.schema]
+        return {column: self[column] for column in order}
+
+
+class _Rows(Mapping):
+    """Selected rows of the columns in a WriteBuffer."""
+
+    def __init__(self, buffer, loc):
+        self.buffer = buffer
+        self.loc = loc
+
+    def __getitem__(self, column):
+        return self.buffer[column][self.loc]
+
+    def __iter__(self):
+        return iter(self.buffer)
+
+    def __len__(self):
+        return len(self.buffer)
@@ -0,0 +1,268 @@
+"""Content based graph fingerprints and a disk-backed result cache.
+
+`fingerprint` identifies a graph by what it computes: its nodes (type, ID,
+label, expressions), edges (in evaluation order, with their labels) and the
+parameter values the expressions reference. Graphs loaded twice from the
+same algo or GraphML file get the same fingerprint, unlike `Pandag.uuid`.
+
+`ResultCache` stores the columns written by the graph on disk, keyed by the
+graph's fingerprint and a hash of the input columns the graph reads or
+overwrites, so evaluating unchanged inputs again only reads the result
+back.
+"""
+import hashlib
+import os
+import pickle
+import tempfile
+import types
+
+import numpy as np
+import pandas as pd
+
+from .nodes import Inequal, expr_local_names, expr_names
+
+# node attributes which don't affect the results
+_LAYOUT_ATTRS = {'_x', '_y', 'local_dict', 'global_dict'}
+
+
+class _Unstable(Exception):
+    """Raised for values without a stable representation."""
+
+
+def _code_token(code, seen):
+    """Return a stable representation of a code object and its nested ones."""
+    consts = ','.join(_code_token(c, seen) if isinstance(c, types.CodeType) else _token(c, seen)
+                      for c in code.co_consts)
+    data = code.co_code + consts.encode() + repr(code.co_names).encode()
+    return hashlib.sha256(data).hexdigest()
+
+
+def _global_names(code):
+    """Return the global names a code object (or its nested ones) may read."""
+    names = set(code.co_names)
+    for const in code.co_consts:
+        if isinstance(const, types.CodeType):
+            names |= _global_names(const)
+    return names
+
+
+def _callable_token(value, seen):
+    """Return a stable representation of a callable, including the values
+    it captures: closure cells, default arguments and referenced globals."""
+    name = f'{getattr(value, "__module__", None)}.{getattr(value, "__qualname__", None)}'
+    if isinstance(value, (types.BuiltinFunctionType, np.ufunc)):
+        return f'builtin({name})'
+    if not isinstance(value, types.FunctionType):
+        raise _Unstable(value)
+    if id(value) in seen:
+        return f'recursive({name})'
+    seen = seen | {id(value)}
+    try:
+        cells = [cell.cell_contents for cell in value.__closure__ or ()]
+    except ValueError:
+        # empty cell, the variable isn't assigned yet
+        raise _Unstable(value)
+    namespace = value.__globals__
+    referenced = {k: namespace[k] for k in sorted(_global_names(value.__code__)) if k in namespace}
+    captured = _token((cells, value.__defaults__, value.__kwdefaults__, referenced), seen)
+    return f'callable({name},{_code_token(value.__code__, seen)},{captured})'
+
+
+def _token(value, seen=frozenset()):
+    """Return a stable string representation of `value`.
+
+    Raises _Unstable if there's none, e.g. for objects with the default
+    repr, which contains their address."""
+    if isinstance(value, dict):
+        items = sorted((_token(k, seen), _token(v, seen)) for k, v in value.items())
+        return '{' + ','.join(f'{k}:{v}' for k, v in items) + '}'
+    if isinstance(value, (list, tuple)):
+        return type(value).__name__ + '(' + ','.join(_token(v, seen) for v in value) + ')'
+    if isinstance(value, (set, frozenset)):
+        # the iteration order depends on the hash seed
+        return type(value).__name__ + '(' + ','.join(sorted(_token(v, seen) for v in value)) + ')'
+    if isinstance(value, np.ndarray):
+        digest = hashlib.sha256(np.ascontiguousarray(value).tobytes()).hexdigest()
+        return f'ndarray({value.dtype.str},{value.shape},{digest})'
+    if isinstance(value, (pd.Series, pd.DataFrame, pd.Index)):
+        return f'{type(value).__name__}({frame_hash(pd.DataFrame(value))})'
+    if isinstance(value, types.ModuleType):
+        return f'module({value.__name__})'
+    if isinstance(value, type):
+        return f'type({value.__module__}.{value.__qualname__})'
+    if callable(value):
+        return _callable_token(value, seen)
+    text = repr(value)
+    if ' at 0x' in text:
+        raise _Unstable(value)
+    return f'{type(value).__name__}({text})'
+
+
+def _expressions(G, node_id, node):
+    """Yield the expressions of a node and its outgoing edges."""
+    for attr in ('query', 'expr'):
+        if isinstance(getattr(node, attr, None), str):
+            yield getattr(node, attr)
+    for value in getattr(node, 'kw', {}).values():
+        if isinstance(value, str):
+            yield value
+    if isinstance(node, Inequal):
+        for _, _, label in G.out_edges(node_id, data='label'):
+            if isinstance(label, str):
+                yield label
+
+
+def _parameters(G, node_id, node):
+    """Return the parameter values the node's expressions reference."""
+    local_dict = getattr(node, 'local_dict', None) or {}
+    global_dict = getattr(node, 'global_dict', None) or {}
+    params = {}
+    for expr in _expressions(G, node_id, node):
+        # @name is looked up in local_dict first, like pandas does
+        for name in expr_local_names(expr):
+            if name in local_dict:
+                params['@' + name] = local_dict[name]
+            elif name in global_dict:
+                params['@' + name] = global_dict[name]
+        for name in expr_names(expr):
+            if name in global_dict:
+                params[name] = global_dict[name]
+    return params
+
+
+def fingerprint(pandag):
+    """Return a content based fingerprint of a graph.
+
+    Callables are fingerprinted by their code and the values they capture
+    (closure cells, default arguments and referenced globals).
+
+    Args:
+        pandag (pandag.Pandag): The graph.
+
+    Returns:
+        str: Hex digest, equal for graphs computing the same results, or
+        None if a value the graph uses has no stable representation (e.g.
+        a callable object or a parameter using the default repr).
+
+    """
+    G = pandag.G
+    h = hashlib.sha256()
+    try:
+        h.update(_token(pandag.path_column).encode())
+        for node_id, node in G.nodes(data='node'):
+            attrs = {k: v for k, v in vars(node).items() if k not in _LAYOUT_ATTRS}
+            edges = [(dst, label) for _, dst, label in G.out_edges(node_id, data='label')]
+            h.update(_token((node_id, type(node).__name__, attrs, edges,
+                             _parameters(G, node_id, node))).encode())
+    except _Unstable:
+        return None
+    return h.hexdigest()
+
+
+def frame_hash(df):
+    """Return a hash of the columns, dtypes, index and values of `df`."""
+    h = hashlib.sha256()
+    h.update(repr([(c, str(df[c].dtype)) for c in df.columns]).encode())
+    h.update(repr((df.index.name, str(df.index.dtype))).encode())
+    h.update(pd.util.hash_pandas_object(df, index=True).to_numpy().tobytes())
+    return h.hexdigest()
+
+
+class ResultCache:
+    """ResultCache keeps evaluation results in a directory.
+
+    Only the columns written by the graph are stored, they are attached to
+    the input frame when read back. When the cache grows beyond `max_bytes`
+    the least recently used results are removed.
+    """
+
+    def __init__(self, path, max_bytes=1 << 30):
+        """
+        Args:
+            path (str): Cache directory, created if it doesn't exist.
+            max_bytes (int): Maximum total size of the cached results.
+
+        """
+        self.path = path
+        self.max_bytes = max_bytes
+        os.makedirs(path, exist_ok=True)
+
+    def key(self, pandag, df):
+        """Return the cache key for evaluating `df` with `pandag`.
+
+        The hashed columns are the ones the graph reads and the ones it
+        overwrites, as rows not written keep their input values. None is
+        returned if the graph has no fingerprint (see `fingerprint`)."""
+        digest = fingerprint(pandag)
+        if digest is None:
+            return None
+        read = set(pandag.input_columns(df.columns))
+        written = pandag.output_columns()
+        columns = [c for c in df.columns if c in read or written is None or c in written]
+        return hashlib.sha256((digest + frame_hash(df[columns])).encode()).hexdigest()
+
+    def _file(self, key):
+        return os.path.join(self.path, key + '.pkl')
+
+    def get(self, key):
+        """Return the written columns stored for `key`, or None."""
+        path = self._file(key)
+        try:
+            with open(path, 'rb') as f:
+                columns = pickle.load(f)
+        except FileNotFoundError:
+            return None
+        # mark it as recently used
+        os.utime(path)
+        return columns
+
+    def put(self, key, columns):
+        """Store the written columns for `key` and evict old results."""
+        fd, tmp = tempfile.mkstemp(dir=self.path, suffix='.tmp')
+        with os.fdopen(fd, 'wb') as f:
+            pickle.dump(columns, f, protocol=pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp, self._file(key))
+        self.evict()
+
+    def evict(self):
+        """Remove the least recently used results above `max_bytes`."""
+        entries = []
+        for entry in os.scandir(self.path):
+            if entry.name.endswith('.pkl'):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, stat.st_size, entry.path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= self.max_bytes:
+                break
+            os.remove(path)
+            total -= size
+
+    def clear(self):
+        """Remove all cached results."""
+        for entry in os.scandir(self.path):
+            if entry.name.endswith('.pkl'):
+                os.remove(entry.path)
+
+    def eval(self, pandag, df):
+        """Evaluate `df` with `pandag`, reusing a cached result if possible.
+
+        Args:
+            pandag (pandag.Pandag): The graph.
+            df (pandas.DataFrame): The DataFrame to be evaluated.
+
+        Returns:
+            pandas.DataFrame: Resulting DataFrame, the same as
+            `pandag.eval(df)`. Graphs without a fingerprint aren't cached.
+
+        """
+        key = self.key(pandag, df)
+        columns = None if key is None else self.get(key)
+        if columns is None:
+            columns = pandag.compile().written_columns(df)
+            if key is not None:
+                self.put(key, columns)
+        res = df.copy(deep=False)
+        for column, values in columns.items():
+            res[column] = values.set_axis(df.index)
+        return res
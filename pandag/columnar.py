@@ -0,0 +1,239 @@
+"""Out-of-core evaluation of memory-mapped columnar files.
+
+Two layouts are supported:
+
+* a directory holding one NumPy `.npy` file per column, named
+  `<column>.npy`,
+* a single Arrow IPC (Feather v2) file.
+
+Only the columns referenced or overwritten by the graph are paged in, one
+chunk of rows at a time, and only the columns written by the graph
+(including the path column) are stored in the output, which uses the same
+layout as the input. The stored types are derived once from the graph's
+output schema, so all chunks are written with the same types, whichever
+rows they hold.
+"""
+import os
+
+import numpy as np
+import pandas as pd
+
+from . import routing
+
+
+def _input_columns(pandag, names):
+    """Return the input columns to page in: the ones the graph reads and the
+    ones it overwrites, as rows not written keep their input values."""
+    read = set(pandag.input_columns(names))
+    written = pandag.output_columns()
+    return [c for c in names if c in read or written is None or c in written]
+
+
+def _storage_kind(dtype, raw):
+    """Return how a result column is stored.
+
+    Args:
+        dtype: The column's dtype in the result (see Pandag.output_schema).
+        raw: The dtype of the written values, before the promotion for
+            missing values.
+
+    Returns:
+        str: 'str', 'bool', 'int', 'float' or 'native' (stored as is).
+
+    """
+    if isinstance(dtype, pd.CategoricalDtype):
+        return 'str'
+    numpy_dtype = getattr(dtype, 'numpy_dtype', dtype)
+    if isinstance(numpy_dtype, np.dtype) and dtype is not numpy_dtype:
+        # nullable extension dtypes
+        return {'b': 'bool', 'i': 'int', 'u': 'int'}.get(numpy_dtype.kind, 'float')
+    if dtype == object:
+        kind = getattr(raw, 'kind', 'O')
+        return {'b': 'bool', 'i': 'int', 'u': 'int', 'f': 'float'}.get(kind, 'str')
+    if dtype.kind == 'f' and getattr(raw, 'kind', None) in ('i', 'u'):
+        return 'int'
+    return 'native'
+
+
+def _str_width(compiled, column, dtype):
+    """Return the longest string a column can hold, 1 if it's not known
+    from the schema."""
+    if isinstance(dtype, pd.CategoricalDtype):
+        return max([len(str(c)) for c in dtype.categories] + [1])
+    if column == compiled.path_column:
+        return routing.max_path_length(compiled.components)
+    return 1
+
+
+def _npy_dtype(dtype, kind, width=1):
+    """Return the `.npy` dtype of a column.
+
+    `.npy` files can't mark missing values, booleans and integers of new
+    columns are stored as float64 with NaN, strings as fixed-width unicode
+    of `width` characters with empty strings."""
+    if kind == 'str':
+        return np.dtype(f'U{width}')
+    if kind == 'native':
+        return dtype
+    return np.dtype(float)
+
+
+def _to_numpy(series, dtype):
+    """Return the values of `series` as `dtype`, with the missing values
+    for that dtype."""
+    if dtype.kind == 'U':
+        series = series.astype(object).where(series.notna(), '')
+        return series.astype(str).to_numpy(dtype=str)
+    if dtype.kind == 'f':
+        return series.to_numpy(dtype=dtype, na_value=np.nan)
+    return series.to_numpy(dtype=dtype)
+
+
+def _arrow_type(dtype, kind):
+    """Return the Arrow type of a column, Arrow marks missing values."""
+    import pyarrow as pa
+
+    if kind == 'str':
+        return pa.string()
+    if kind == 'bool':
+        return pa.bool_()
+    if kind == 'int':
+        return pa.int64()
+    return pa.from_numpy_dtype(getattr(dtype, 'numpy_dtype', dtype))
+
+
+def _to_arrow(series, type_):
+    import pyarrow as pa
+
+    if pa.types.is_string(type_):
+        series = series.astype(object)
+        series = series.where(series.isna(), series.astype(str))
+    elif series.dtype == object or pa.types.is_integer(type_):
+        series = series.astype(object).where(series.notna(), None)
+    return pa.array(series, type=type_, from_pandas=True)
+
+
+def _schema(pandag, sample):
+    """Return the result dtypes and storage kinds of the written columns."""
+    schema = pandag.output_schema(sample)
+    raw = pandag.output_schema(sample, promote=False)
+    return schema, {column: _storage_kind(dtype, raw.get(column))
+                    for column, dtype in schema.items()}
+
+
+class _NpyWriter:
+    """Write a column into a memory-mapped `.npy` file chunk by chunk."""
+
+    def __init__(self, path, nrows, dtype):
+        self.path = path
+        self.nrows = nrows
+        self.array = np.lib.format.open_memmap(path, mode='w+', dtype=dtype, shape=(nrows,))
+
+    def _widen(self, dtype):
+        """Re-create the output file with a wider dtype, when a later chunk
+        holds longer strings than the schema tells."""
+        tmp_path = f'{self.path}.tmp'
+        array = np.lib.format.open_memmap(tmp_path, mode='w+', dtype=dtype,
+                                          shape=(self.nrows,))
+        array[:] = self.array
+        array.flush()
+        del self.array
+        os.replace(tmp_path, self.path)
+        self.array = array
+
+    def write(self, start, values):
+        dtype = np.promote_types(self.array.dtype, values.dtype)
+        if dtype != self.array.dtype:
+            if dtype.kind == 'U':
+                # at least double the width, so the file is rewritten only a
+                # few times
+                dtype = np.dtype(f'U{max(dtype.itemsize, 2 * self.array.dtype.itemsize) // 4}')
+            self._widen(dtype)
+        self.array[start:start + len(values)] = values
+
+    def close(self):
+        if self.array is not None:
+            self.array.flush()
+            self.array = None
+
+
+def _eval_npy(pandag, path_in, path_out, chunksize):
+    paths = {fn[:-len('.npy')]: os.path.join(path_in, fn)
+             for fn in sorted(os.listdir(path_in)) if fn.endswith('.npy')}
+    assert paths, f"No .npy files found in {path_in}"
+    arrays = {column: np.load(paths[column], mmap_mode='r')
+              for column in _input_columns(pandag, list(paths))}
+    nrows = len(np.load(next(iter(paths.values())), mmap_mode='r'))
+    os.makedirs(path_out, exist_ok=True)
+    compiled = pandag.compile()
+    schema = dtypes = writers = None
+    for start in range(0, nrows, chunksize):
+        stop = min(start + chunksize, nrows)
+        # only this chunk of the referenced columns gets paged in
+        chunk = pd.DataFrame({column: array[start:stop]
+                              for column, array in arrays.items()},
+                             index=pd.RangeIndex(start, stop))
+        if schema is None:
+            schema, kinds = _schema(pandag, chunk.head(1))
+            dtypes = {column: _npy_dtype(schema[column], kind,
+                                         _str_width(compiled, column, schema[column]))
+                      for column, kind in kinds.items()}
+            writers = {column: _NpyWriter(os.path.join(path_out, f'{column}.npy'), nrows,
+                                          dtypes[column])
+                       for column in schema}
+        res = compiled.eval(chunk, schema=schema)
+        for column, writer in writers.items():
+            writer.write(start, _to_numpy(res[column], dtypes[column]))
+    for writer in (writers or {}).values():
+        writer.close()
+
+
+def _eval_arrow(pandag, path_in, path_out, chunksize):
+    import pyarrow as pa
+    import pyarrow.ipc
+
+    reader = pa.ipc.open_file(pa.memory_map(path_in, 'r'))
+    columns = _input_columns(pandag, reader.schema.names)
+    compiled = pandag.compile()
+    schema = out_schema = writer = None
+    offset = 0
+    try:
+        for i in range(reader.num_record_batches):
+            batch = reader.get_batch(i).select(columns)
+            for start in range(0, batch.num_rows, chunksize):
+                chunk = batch.slice(start, chunksize).to_pandas()
+                chunk.index = pd.RangeIndex(offset, offset + len(chunk))
+                offset += len(chunk)
+                if schema is None:
+                    schema, kinds = _schema(pandag, chunk.head(1))
+                    out_schema = pa.schema([(column, _arrow_type(schema[column], kind))
+                                            for column, kind in kinds.items()])
+                    writer = pa.ipc.new_file(path_out, out_schema)
+                res = compiled.eval(chunk, schema=schema)
+                writer.write_batch(pa.record_batch(
+                    [_to_arrow(res[field.name], field.type) for field in out_schema],
+                    schema=out_schema))
+    finally:
+        if writer is not None:
+            writer.close()
+
+
+def eval_file(pandag, path_in, path_out, chunksize=1_000_000):
+    """Evaluate a memory-mapped columnar input without loading it fully.
+
+    Args:
+        pandag (pandag.Pandag): The graph to evaluate.
+        path_in (str): Directory of per-column `.npy` files or an Arrow
+            IPC/Feather file.
+        path_out (str): Output directory (for `.npy` input) or Arrow IPC
+            file, holding the columns written by the graph.
+        chunksize (int): Number of rows evaluated at once.
+
+    Returns:
+        None
+
+    """
+    if os.path.isdir(path_in):
+        _eval_npy(pandag, path_in, path_out, chunksize)
+    else:
+        _eval_arrow(pandag, path_in, path_out, chunksize)
@@ -0,0 +1,136 @@
+"""Evaluation of many parameter variants of the same graph.
+
+The graph is compiled once, and each variant is a copy of the compiled graph
+whose nodes only differ by their `local_dict`, so the parsed expressions are
+shared. Conditions which depend neither on the varying parameters nor on
+columns written by Output nodes are evaluated once and reused by all the
+variants, the others (and the Output nodes) are evaluated in a pass per
+variant. The path column is built from path IDs (see pandag.routing).
+"""
+import copy
+
+import numpy as np
+import pandas as pd
+
+from . import routing
+from .nodes import FusedOutput, Output, expr_local_names, expr_names
+from .runtime import CompiledDag, _condition_expr
+
+
+def _variant(compiled, params):
+    """Return a copy of `compiled` with the parameters substituted.
+
+    The nodes are shallow copies, only their `local_dict` differs."""
+    # nodes usually share the same local_dict, so do the copies
+    local_dicts = {}
+    copies = {}
+
+    def substitute(node):
+        if id(node) in copies:
+            return copies[id(node)]
+        if isinstance(node, FusedOutput):
+            new = copy.copy(node)
+            new.outputs = [substitute(output) for output in node.outputs]
+        elif hasattr(node, 'local_dict'):
+            key = id(node.local_dict)
+            if key not in local_dicts:
+                local_dicts[key] = {**(node.local_dict or {}), **params}
+            new = copy.copy(node)
+            new.local_dict = local_dicts[key]
+        else:
+            new = node
+        copies[id(node)] = new
+        return new
+
+    components = [(start, [(node_id, substitute(node), edges) for node_id, node, edges in steps])
+                  for start, steps in compiled.components]
+    return CompiledDag(compiled.node_ids, components,
+                       [substitute(node) for node in compiled.outputs],
+                       path_column=compiled.path_column)
+
+
+def _shared_masks(pandag, compiled, df, varying):
+    """Evaluate the parameter independent conditions once."""
+    written = pandag.output_columns()
+    if written is None:
+        return {}
+    written = set(written)
+    masks = {}
+    for _, steps in compiled.components:
+        for node_id, node, edges in steps:
+            if isinstance(node, Output):
+                continue
+            for dst, data in edges:
+                expr = _condition_expr(node, data)
+                if (data.get('always') or expr is None
+                        or expr_local_names(expr) & varying or expr_names(expr) & written):
+                    continue
+                masks[(node_id, dst)] = np.asarray(node.eval(df, data), dtype=bool)
+    return masks
+
+
+def _schema(compiled, df, varying):
+    """Return the output schema shared by the variants, or None if Output
+    nodes reference the varying parameters."""
+    for node in compiled.outputs:
+        exprs = [node.expr, *node.kw.values()]
+        if any(isinstance(expr, str) and expr_local_names(expr) & varying for expr in exprs):
+            return None
+    return compiled.output_schema(df.head(1))
+
+
+def eval_grid(pandag, df, param_sets):
+    """Evaluate `df` with each set of `local_dict` parameters.
+
+    Args:
+        pandag (pandag.Pandag): The graph to evaluate.
+        df (pandas.DataFrame): The DataFrame to be evaluated.
+        param_sets (dict, list): Variant key -> {parameter: value} mapping
+            (or a list of them, keyed by position), overriding the nodes'
+            `local_dict` values. None values keep the graph's value.
+
+    Returns:
+        dict: Variant key -> resulting DataFrame, the same as evaluating
+        the graph loaded with the variant's parameters.
+
+    """
+    if not isinstance(param_sets, dict):
+        param_sets = dict(enumerate(param_sets))
+    if not param_sets:
+        return {}
+    varying = set()
+    for params in param_sets.values():
+        varying.update(params)
+    compiled = pandag.compile()
+    masks = _shared_masks(pandag, compiled, df, varying)
+    schema = _schema(compiled, df, varying)
+
+    numbering = None
+    if compiled.path_column:
+        # the variants take the same paths, building the path strings of
+        # the path IDs' unique values is much cheaper than per row
+        numbering = compiled.numbering()
+        try:
+            routing.path_id_dtype(numbering)
+        except ValueError:
+            numbering = None
+
+    results = {}
+    for key, params in param_sets.items():
+        variant = _variant(compiled, {name: value for name, value in params.items()
+                                      if value is not None})
+        res = df.copy(deep=False)
+        if numbering is None:
+            columns = variant.written_columns(df, schema=schema, masks=masks)
+        else:
+            buffer, _, _, path_ids = variant._evaluate(df, paths=False, numbering=numbering,
+                                                       schema=schema, masks=masks)
+            columns = buffer.columns()
+            ids, inverse = np.unique(path_ids, return_inverse=True)
+            paths = np.array([routing.decode_path(numbering, i) for i in ids], dtype=object)
+            columns[compiled.path_column] = pd.Series(paths[inverse], index=df.index,
+                                                      name=compiled.path_column)
+        for column, values in columns.items():
+            res[column] = values
+        results[key] = res
+    return results
@@ -1,5 +1,127 @@
 """Pandag nodes."""
+import ast
+import io
+import keyword
+import re
+import tokenize
+
 import numpy as np
+import pandas as pd
+
+_assignment_re = re.compile(r"^\s*(?P<column>[A-Za-z_]\w*)\s*=(?!=)(?P<value>.*)$")
+
+
+def _strip_comment(line):
+    """Return `line` without its trailing comment."""
+    try:
+        for tok in tokenize.generate_tokens(io.StringIO(line).readline):
+            if tok.type == tokenize.COMMENT:
+                return line[:tok.start[1]]
+    except (tokenize.TokenError, SyntaxError):
+        pass
+    return line
+
+
+def _constant_string(value):
+    """Return the string if `value` is a plain string literal, else None."""
+    try:
+        const = ast.literal_eval(value.strip())
+    except (ValueError, SyntaxError):
+        return None
+    return const if isinstance(const, str) else None
+
+
+def expr_names(expr):
+    """Return the set of bare names (possible column references) in `expr`.
+
+    Local variables referenced with `@` and Python keywords are skipped. The
+    result is a superset of the referenced columns, as it may include
+    function and attribute names too."""
+    names = set(re.findall(r"`([^`]+)`", expr))
+    expr = re.sub(r"`[^`]+`", " ", expr)
+    prev = None
+    try:
+        for tok in tokenize.generate_tokens(io.StringIO(expr).readline):
+            if (tok.type == tokenize.NAME and not keyword.iskeyword(tok.string)
+                    and not (prev and prev.string == "@")):
+                names.add(tok.string)
+            prev = tok
+    except (tokenize.TokenError, SyntaxError):
+        pass
+    return names
+
+
+def expr_local_names(expr):
+    """Return the set of local variable names referenced with `@` in `expr`."""
+    return set(re.findall(r"@([A-Za-z_]\w*)", expr))
+
+
+# expression nodes which combine values of the same row only
+_ELEMENTWISE_NODES = (ast.Expression, ast.BoolOp, ast.BinOp, ast.UnaryOp,
+                      ast.Compare, ast.Name, ast.Constant, ast.Load,
+                      ast.boolop, ast.operator, ast.unaryop, ast.cmpop)
+
+
+def expr_elementwise(expr):
+    """Return True if `expr` only combines values of the same row.
+
+    Such an expression gives the same result for a row when evaluated on a
+    subset of the frame. Only operators on names and constants are
+    accepted, function calls and attribute access (e.g. `x > x.mean()`)
+    aren't. `in` needs a literal list or an `@` variable on its right."""
+    expr = re.sub(r"`[^`]+`", "_backtick", expr)
+    expr = re.sub(r"@(?=[A-Za-z_])", "_local_", expr)
+    try:
+        tree = ast.parse(expr.strip(), mode='eval')
+    except SyntaxError:
+        return False
+    for node in ast.walk(tree):
+        if isinstance(node, (ast.List, ast.Tuple, ast.Set)):
+            if not all(isinstance(elt, ast.Constant) for elt in node.elts):
+                return False
+        elif not isinstance(node, _ELEMENTWISE_NODES):
+            return False
+        if isinstance(node, ast.Compare):
+            for op, right in zip(node.ops, node.comparators):
+                if (isinstance(op, (ast.In, ast.NotIn))
+                        and not isinstance(right, (ast.List, ast.Tuple, ast.Set))
+                        and not (isinstance(right, ast.Name) and right.id.startswith('_local_'))):
+                    return False
+    return True
+
+
+def split_assignments(expr):
+    """Split a (multi-line) eval expression into (column, value) pairs.
+
+    Return None if any of the lines is not a simple `column = value`
+    assignment, in which case the expression should be handed to
+    `DataFrame.eval` as a whole."""
+    assignments = []
+    for line in expr.splitlines():
+        line = _strip_comment(line)
+        if not line.strip():
+            continue
+        m = _assignment_re.match(line)
+        if not m:
+            return None
+        assignments.append((m.group("column"), m.group("value").strip()))
+    return assignments
+
+
+def assign(df, loc, column, value):
+    """Set `column` to `value` on the rows selected by `loc`.
+
+    Constant strings are stored as categoricals, so a column holding a
+    handful of labels costs one small integer per row instead of a Python
+    object."""
+    if isinstance(value, str):
+        if column not in df:
+            df[column] = pd.Categorical.from_codes(
+                np.full(len(df), -1, dtype=np.int8), categories=[value])
+        elif (isinstance(df[column].dtype, pd.CategoricalDtype)
+              and value not in df[column].cat.categories):
+            df[column] = df[column].cat.add_categories([value])
+    df.loc[loc, column] = value
 
 
 class Node:
@@ -10,13 +132,25 @@ class Node:
             yield from subclass.get_subclasses()
             yield subclass
 
-    def eval(self, df, edge_data):
+    def eval(self, df, edge_data, resolvers=()):
         """Return True for all rows."""
-        return [True]*len(df)
+        return np.ones(len(df), dtype=bool)
 
     def update(self, df, loc):
         pass
 
+    def names(self):
+        """Return the names referenced by the node's own expressions.
+
+        None means the node may access any column."""
+        return set()
+
+    def columns(self):
+        """Return the columns this node writes.
+
+        None means the written columns can't be determined statically."""
+        return []
+
 
 class Assert(Node):
     """Assert node partitions the rows into two based on the incoming condition."""
@@ -34,10 +168,14 @@ class Assert(Node):
         if not _label:
             self.label = query
 
-    def eval(self, df, edge_data):
+    def names(self):
+        return expr_names(self.query)
+
+    def eval(self, df, edge_data, resolvers=()):
         res = df.eval(self.query,
                       local_dict=self.local_dict,
-                      global_dict=self.global_dict)
+                      global_dict=self.global_dict,
+                      resolvers=resolvers)
         if edge_data['label']:
             return res
         return np.invert(res)
@@ -58,42 +196,146 @@ class Output(Node):
         self.global_dict = global_dict
         self.kw = kw
 
-    def update(self, df, loc):
+    def _eval_value(self, df, value, resolvers=()):
+        """Evaluate the right hand side of an assignment.
+
+        Plain string literals are returned as `str`, so they can be stored
+        as categoricals instead of being broadcast to an object column."""
+        const = _constant_string(value)
+        if const is not None:
+            return const
+        return df.eval(value,
+                       local_dict=self.local_dict,
+                       global_dict=self.global_dict,
+                       resolvers=resolvers)
+
+    @staticmethod
+    def _resolved(df, resolvers):
+        """Return `df` with the columns of `resolvers`, for callables."""
+        if not resolvers:
+            return df
+        df = df.copy(deep=False)
+        # earlier resolvers take precedence, as with DataFrame.eval
+        for resolver in reversed(resolvers):
+            for column in resolver:
+                df[column] = resolver[column]
+        return df
+
+    def assignments(self, df, resolvers=()):
+        """Yield (column, value) pairs this node writes.
+
+        Values are either scalars or Series aligned with `df`."""
         for k, v in self.kw.items():
             if callable(v):
-                df.loc[loc, k] = df.apply(v, axis=1)
+                yield k, self._resolved(df, resolvers).apply(v, axis=1)
             else:
-                df.loc[loc, k] = df.eval(v,
-                                         local_dict=self.local_dict,
-                                         global_dict=self.global_dict)
+                yield k, self._eval_value(df, v, resolvers)
         if self.expr:
-            # If there was an eval expression specified, update matching rows
-            # with it.
             # Expressions can update multiple columns, if separated by newlines
-            eval_df = df.eval(self.expr,
-                              local_dict=self.local_dict,
-                              global_dict=self.global_dict)
-            df.loc[loc, eval_df.columns] = eval_df
+            assignments = split_assignments(self.expr)
+            if assignments is None:
+                eval_df = df.eval(self.expr,
+                                  local_dict=self.local_dict,
+                                  global_dict=self.global_dict,
+                                  resolvers=resolvers)
+                for column in eval_df.columns:
+                    yield column, eval_df[column]
+                return
+            # later lines may refer to columns assigned by earlier ones
+            assigned = {}
+            for column, value in assignments:
+                assigned[column] = self._eval_value(df, value,
+                                                    (assigned, *resolvers))
+                yield column, assigned[column]
+
+    def names(self):
+        names = set()
+        for v in self.kw.values():
+            if callable(v):
+                return None
+            names |= expr_names(v)
+        if self.expr:
+            names |= expr_names(self.expr)
+        return names
+
+    def columns(self):
+        columns = list(self.kw)
+        if self.expr:
+            assignments = split_assignments(self.expr)
+            if assignments is None:
+                return None
+            for column, _ in assignments:
+                if column not in columns:
+                    columns.append(column)
+        return columns
+
+    def update(self, df, loc):
+        # If there was an eval expression specified, update matching rows
+        # with it.
+        for column, value in list(self.assignments(df)):
+            assign(df, loc, column, value)
+
+
+class FusedOutput(Output):
+    """FusedOutput applies a chain of Output nodes in a single step."""
+
+    def __init__(self, outputs):
+        first = outputs[0]
+        super().__init__(_label=' + '.join(str(o.label) for o in outputs),
+                         _id=first.id, _x=first._x, _y=first._y)
+        self.outputs = outputs
+
+    def names(self):
+        names = set()
+        for output in self.outputs:
+            output_names = output.names()
+            if output_names is None:
+                return None
+            names |= output_names
+        return names
+
+    def columns(self):
+        columns = []
+        for output in self.outputs:
+            output_columns = output.columns()
+            if output_columns is None:
+                return None
+            columns.extend(c for c in output_columns if c not in columns)
+        return columns
+
+    def assignments(self, df, resolvers=()):
+        # later outputs see the values assigned by the earlier ones
+        assigned = {}
+        for output in self.outputs:
+            for column, value in list(output.assignments(df, (assigned, *resolvers))):
+                assigned[column] = value
+                yield column, value
 
 
 class Inequal(Node):
-    """Inequal node evaluates a given condition."""
+    """Inequal node evaluates a given condition.
+
+    If `exclusive` is True, at most one of the outgoing edges' conditions
+    match for any row, so they can be tested in any order (most likely
+    first, see Pandag.profile)."""
     plot_shape = 'h'
 
     def __init__(self, _label=None, _id=None, _x=None, _y=None,
-                 local_dict=None, global_dict=None, **kw):
+                 local_dict=None, global_dict=None, exclusive=None, **kw):
         self.label = _label
         self.id = _id
         self._x = _x
         self._y = _y
         self.local_dict = local_dict
         self.global_dict = global_dict
+        self.exclusive = exclusive
         self.kw = kw
 
-    def eval(self, df, edge_data):
+    def eval(self, df, edge_data, resolvers=()):
         return df.eval(edge_data['label'],
                        local_dict=self.local_dict,
-                       global_dict=self.global_dict)
+                       global_dict=self.global_dict,
+                       resolvers=resolvers)
 
 
 class Dummy(Node):
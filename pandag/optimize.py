@@ -0,0 +1,151 @@
+"""Graph-level optimisations.
+
+The optimised graph is only used for evaluation, `Pandag.G` is left intact
+for plotting. Edges of the optimised graph carry the IDs of the original
+nodes they pass through in `hops`, so the path column stays the same as
+without optimisation, and edges which take all the rows waiting at their
+source node are marked with `always`.
+"""
+import networkx as nx
+import numpy as np
+import pandas as pd
+
+from .nodes import Node, Assert, Inequal, Output, FusedOutput
+
+
+def _constant(node, expr):
+    """Return the value of `expr` if it doesn't depend on the frame, else None.
+
+    Column references can't be resolved in a frame without columns, so only
+    expressions of literals and `@` variables evaluate to a scalar."""
+    try:
+        res = pd.DataFrame(index=[0]).eval(expr,
+                                           local_dict=node.local_dict,
+                                           global_dict=node.global_dict)
+    except Exception:
+        return None
+    if np.ndim(res) != 0:
+        return None
+    return bool(res)
+
+
+def _fold(node, edges):
+    """Return the edges of `node` which can be taken, in order."""
+    if isinstance(node, Inequal):
+        folded = []
+        for dst, data in edges:
+            label = data.get('label')
+            value = _constant(node, label) if isinstance(label, str) else None
+            if value is False:
+                continue
+            folded.append((dst, data))
+            if value:
+                # takes all the remaining rows, the later edges get none
+                data['always'] = True
+                break
+        return folded
+    if isinstance(node, Assert):
+        value = _constant(node, node.query)
+        if value is None:
+            return edges
+        edges = [(dst, data) for dst, data in edges
+                 if bool(data.get('label')) == value][:1]
+    elif type(node).eval is Node.eval:
+        # all rows take the first edge
+        edges = edges[:1]
+    else:
+        return edges
+    for _, data in edges:
+        data['always'] = True
+    return edges
+
+
+def _pass_through(node, edges):
+    """Return True if all rows reaching `node` leave it on its only edge."""
+    return (not isinstance(node, Output) and len(edges) == 1
+            and edges[0][1].get('always', False))
+
+
+def optimize(G, start_nodes):
+    """Return an optimised copy of the graph.
+
+    - folds constant Assert and Inequal conditions (ones which only depend on
+      `local_dict`/`global_dict` values) and drops the branches they rule out,
+    - drops the edges no rows can take (all rows leave Dummy and Output
+      nodes on their first edge),
+    - removes the nodes which became unreachable,
+    - collapses pass-through nodes into the edges leading through them,
+    - fuses Output -> Output chains into a single FusedOutput node.
+
+    Args:
+        G (networkx.DiGraph): The graph, with pandag nodes in the `node`
+            attribute.
+        start_nodes (list): Start node IDs.
+
+    Returns:
+        networkx.DiGraph: The optimised graph.
+
+    """
+    nodes = {node_id: data['node'] for node_id, data in G.nodes(data=True)}
+    out = {}
+    for node_id in G.nodes:
+        edges = [(dst, dict(data, hops=list(data.get('hops', [dst]))))
+                 for _, dst, data in G.out_edges(node_id, data=True)]
+        out[node_id] = _fold(nodes[node_id], edges)
+
+    # remove the nodes which can't be reached anymore
+    reachable = set(start_nodes)
+    stack = list(start_nodes)
+    while stack:
+        for dst, _ in out[stack.pop()]:
+            if dst not in reachable:
+                reachable.add(dst)
+                stack.append(dst)
+    out = {node_id: edges for node_id, edges in out.items() if node_id in reachable}
+
+    changed = True
+    while changed:
+        changed = False
+        preds = {node_id: [] for node_id in out}
+        for src, edges in out.items():
+            for dst, _ in edges:
+                preds[dst].append(src)
+        for node_id, edges in out.items():
+            node = nodes[node_id]
+            if node_id in start_nodes or not preds[node_id]:
+                continue
+            if _pass_through(node, edges):
+                (dst, data), = edges
+                if any(dst in [d for d, _ in out[p]] for p in preds[node_id]):
+                    # the predecessor already has an edge to dst
+                    continue
+                for p in preds[node_id]:
+                    out[p] = [(dst, dict(d, hops=d['hops'] + data['hops']))
+                              if d_dst == node_id else (d_dst, d)
+                              for d_dst, d in out[p]]
+                del out[node_id]
+                changed = True
+                break
+            if (isinstance(node, Output) and len(edges) == 1
+                    and edges[0][1].get('always', False)):
+                (dst, data), = edges
+                # end nodes are never evaluated, so they can't be fused
+                if (isinstance(nodes[dst], Output) and preds[dst] == [node_id]
+                        and dst not in start_nodes and out[dst]):
+                    outputs = []
+                    for n in (node, nodes[dst]):
+                        outputs.extend(n.outputs if isinstance(n, FusedOutput) else [n])
+                    nodes[node_id] = FusedOutput(outputs)
+                    out[node_id] = [(d_dst, dict(d, hops=data['hops'] + d['hops']))
+                                    for d_dst, d in out.pop(dst)]
+                    changed = True
+                    break
+
+    plan = nx.DiGraph()
+    for node_id in G.nodes:
+        if node_id in out:
+            plan.add_node(node_id, node=nodes[node_id])
+    for node_id, edges in out.items():
+        for dst, data in edges:
+            plan.add_edge(node_id, dst, **data)
+    return plan
@@ -2,11 +2,8 @@
 
 import uuid
 import networkx as nx
-from pandag.nodes import Node, Output
-from pandag import plot, graphml
-import more_itertools
-import itertools
-import logging
+from pandag.nodes import Node, Output, Inequal, expr_names
+from pandag import cache as result_cache, columnar, partitioned, optimize, grid, runtime, stats
 
 
 class FakeDiGraph(nx.DiGraph):
@@ -22,14 +19,23 @@ class Pandag:
         self.nodes = {}
         self.node_ids = {}
         self.G = FakeDiGraph()
+        # optimised graph used for evaluation, see Pandag.optimize
+        self.plan = None
+        # compiled graph, see Pandag.compile
+        self._compiled = None
         self.uuid = str(uuid.uuid4())
 
     def load_algo(self, algo, local_dict=None, global_dict=None):
         """Creates the DAG from a python data structure."""
+        self.plan = None
+        self._compiled = None
         self.create_graph(algo, local_dict=local_dict, global_dict=global_dict)
 
     def load_graphml(self, path, local_dict=None, global_dict=None, **kwargs):
         """Load an algo from a GraphML file located at `path`."""
+        self.plan = None
+        self._compiled = None
+        from pandag import graphml
         graphml.load(self, path, local_dict=local_dict,
                      global_dict=global_dict, **kwargs)
 
@@ -58,6 +64,7 @@ class Pandag:
                 self.node_ids[self.next_node_id] = node
                 self.next_node_id += 1
             self.G.add_node(self.nodes[node], node=node)
+            self._compiled = None
         return self.nodes[node]
 
     def get_node(self, node_id):
@@ -83,6 +90,9 @@ class Pandag:
             None
 
         """
+        import more_itertools
+
+        self._compiled = None
         for k, v in sub.items():
             if isinstance(k, Node):
                 # add local/global dicts to the node if specified
@@ -137,72 +147,289 @@ class Pandag:
         """Return nodes which don't have outgoing edges."""
         return [node for node in self.G.nodes if self.G.out_degree(node) == 0]
 
-    def eval(self, df):
+    def optimize(self):
+        """Optimise the graph for evaluation.
+
+        Constant conditions are folded, unreachable branches removed,
+        pass-through nodes collapsed and Output chains fused, see
+        pandag.optimize.optimize. The results, including the path column,
+        stay the same. The optimised graph is stored in `self.plan` and used
+        by eval until the graph is reloaded; `self.G` is left unchanged.
+
+        Returns:
+            None
+
+        """
+        self.plan = optimize.optimize(self.G, self.start_nodes())
+        self._compiled = None
+
+    def eval_graph(self):
+        """Return the graph used for evaluation."""
+        return self.G if self.plan is None else self.plan
+
+    def components(self):
+        """Return the evaluation order of the graph for each start node.
+
+        While not recommended, the graph can have multiple start nodes (even
+        multiple DAGs). Each of them is evaluated separately, in the order
+        the start nodes were added to the graph, so the results don't depend
+        on set iteration order. Start nodes without outgoing edges are
+        skipped.
+
+        Returns:
+            list: (start node ID, [node IDs reachable from it, in
+            topological order]) tuples.
+
+        """
+        G = self.eval_graph()
+        order = list(nx.topological_sort(G))
+        components = []
+        for start in self.start_nodes():
+            if self.G.out_degree(start) == 0:
+                continue
+            reachable = nx.descendants(G, start)
+            reachable.add(start)
+            components.append((start, [n for n in order if n in reachable]))
+        return components
+
+    def referenced_names(self):
+        """Return the names referenced by node and edge expressions.
+
+        Returns:
+            set: Possible column names, or None if any column may be used
+            (e.g. an Output node with a callable).
+
+        """
+        names = set()
+        for node_id, node in self.node_ids.items():
+            node_names = node.names()
+            if node_names is None:
+                return None
+            names |= node_names
+            if isinstance(node, Inequal):
+                for _, _, label in self.G.out_edges(node_id, data='label'):
+                    if isinstance(label, str):
+                        names |= expr_names(label)
+        return names
+
+    def input_columns(self, columns):
+        """Return the subset of `columns` the graph reads.
+
+        Args:
+            columns (iterable): Available column names.
+
+        Returns:
+            list: Referenced columns, in the order of `columns`.
+
+        """
+        names = self.referenced_names()
+        return [c for c in columns if names is None or c in names]
+
+    def output_columns(self):
+        """Return the columns written by the graph, including the path column.
+
+        Returns:
+            list: Column names, or None if they can't be determined
+            statically.
+
+        """
+        columns = []
+        for node in self._outputs():
+            node_columns = node.columns()
+            if node_columns is None:
+                return None
+            for column in node_columns:
+                if column not in columns:
+                    columns.append(column)
+        if self.path_column:
+            columns.append(self.path_column)
+        return columns
+
+    def output_schema(self, sample, promote=True):
+        """Derive the dtypes of the columns written by the graph.
+
+        The Output nodes' expressions are evaluated on `sample` (a small,
+        non-empty frame with the input's dtypes), see
+        pandag.runtime.output_schema
+
+        Args:
+            sample (pandas.DataFrame): Non-empty frame with the input columns.
+            promote (bool): Promote the dtypes of new columns to hold
+                missing values.
+
+        Returns:
+            dict: Column name -> dtype, in output column order.
+
+        """
+        return runtime.output_schema(self._outputs(), sample, self.path_column,
+                                     promote=promote)
+
+    def _outputs(self):
+        """Return the applied Output nodes in topological order.
+
+        Output nodes without outgoing edges are never applied, so their
+        columns aren't part of the result."""
+        return [self.get_node(node_id) for node_id in nx.topological_sort(self.G)
+                if isinstance(self.get_node(node_id), Output) and self.G.out_degree(node_id)]
+
+    def compile(self):
+        """Compile the graph for evaluation.
+
+        The compiled graph (using the optimised graph, if there's one) can
+        be pickled and evaluated without networkx, see pandag.runtime. The
+        edges of nodes with mutually exclusive conditions are ordered by
+        their hits, see `profile`.
+
+        The result is cached until the graph is reloaded, optimised or
+        profiled. Call `invalidate` after modifying `self.G` directly.
+
+        Returns:
+            pandag.runtime.CompiledDag: The compiled graph.
+
+        """
+        if self._compiled is None:
+            self._compiled = self._compile()
+        return self._compiled
+
+    def invalidate(self):
+        """Drop the cached compiled graph, see `compile`."""
+        self._compiled = None
+
+    def _compile(self):
+        G = self.eval_graph()
+        components = []
+        for start, nodes in self.components():
+            steps = []
+            for node_id in nodes:
+                node = G.nodes[node_id]['node']
+                edges = [(dst, dict(data)) for _, dst, data in G.out_edges(node_id, data=True)]
+                steps.append((node_id, node, stats.order_edges(node, edges)))
+            components.append((start, steps))
+        return runtime.CompiledDag(list(self.G.nodes), components, self._outputs(),
+                                   path_column=self.path_column)
+
+    def _evaluate(self, df, **kwargs):
+        """Move the rows of `df` through the graph.
+
+        See pandag.runtime.CompiledDag._evaluate
+
+        """
+        return self.compile()._evaluate(df, **kwargs)
+
+    def fingerprint(self):
+        """Return a content based fingerprint of the graph.
+
+        Unlike `uuid`, it's the same for graphs loaded from the same algo
+        with the same parameters, see pandag.cache.fingerprint
+
+        Returns:
+            str: Hex digest, None if the graph uses values without a stable
+            representation, such graphs aren't cached.
+
+        """
+        return result_cache.fingerprint(self)
+
+    def eval(self, df, cache=None):
         """Evaluate a Pandas DataFrame with the graph.
 
         Args:
             df (pandas.DataFrame): The DataFrame to be evaluated.
+            cache (pandag.cache.ResultCache): Reuse the result of an earlier
+                evaluation of the same graph on the same input columns.
 
         Returns:
             pandas.DataFrame: Resulting DataFrame.
 
         """
-        # generate a unique column name
-        node_col = f'{self.uuid}_curr_node'
-        # while not recommended, handle multiple start nodes (even multiple
-        # DAGs) in a general way, so we detect all start and end nodes
-        start_nodes_visited = set()
-        start_nodes = set(self.start_nodes())
-        end_nodes = set(self.end_nodes())
-        if len(start_nodes) > 1:
-            logging.warning(f"The DAG has {len(start_nodes)}, output might be non-deterministic!")
-
-        # loop through all start->end permutations
-        for start, end in itertools.product(start_nodes, end_nodes):
-            if start in end_nodes or end in start_nodes:
-                # exclude backwards permutations (end -> start)
-                continue
-            if self.path_column:
-                # for the first run, we initialize the column with a string,
-                # after that we're just appending
-                if start_nodes_visited:
-                    if start not in start_nodes_visited:
-                        df[self.path_column] = df[self.path_column] + f',{start}'
-                else:
-                    # initialize the path column with the first node id as string, so
-                    # we can later append new node IDs with a vectorized operation
-                    df[self.path_column] = str(start)
-            # (re)set the current node ID for each new start nodes
-            # if we've already visited this start node, leave the field alone,
-            # so we can make progress on sub-frames which are at a given node
-            # ID from a different path
-            if start not in start_nodes_visited:
-                df[node_col] = start
-            for path in nx.all_simple_edge_paths(self.G, start, end):
-                # this represents an edge between two nodes (src -> dst) in the path
-                for (src_node_id, dst_node_id) in path:
-                    edge_data = self.G.get_edge_data(src_node_id, dst_node_id)
-                    src_node = self.get_node(src_node_id)
-
-                    flt = (df[node_col] == src_node_id)
-                    if isinstance(src_node, Output):
-                        src_node.update(df, flt)
-                    else:
-                        flt &= (src_node.eval(df, edge_data))
-                    # update the matching rows' curr_node column to the next node,
-                    # we'll use this to select the source rows for running the
-                    # edge pointing from this node to the next
-                    df.loc[flt, node_col] = dst_node_id
-                    if self.path_column:
-                        # store the path which touched these rows
-                        df.loc[flt, self.path_column] = df[self.path_column] + f',{dst_node_id}'
-
-            # record that we've already visited this start node
-            start_nodes_visited.add(start)
-
-        # remove the temporary current node column
-        df = df.drop(node_col, axis=1)
-        return df
+        if cache is not None:
+            return cache.eval(self, df)
+        return self.compile().eval(df)
+
+    def route(self, df, path_ids=False):
+        """Return the node each row ends up in, without applying the outputs.
+
+        Only the Output nodes writing columns which are read by conditions
+        (directly or through other Output nodes) are evaluated, and no path
+        strings are built.
+
+        Args:
+            df (pandas.DataFrame): The DataFrame to be routed.
+            path_ids (bool): Also return an integer path ID for each row,
+                see `decode_path`.
+
+        Returns:
+            pandas.Categorical: Node ID of the terminal (or the node the
+            row got stuck at) for each row, stored as compact integer codes.
+            With multiple start nodes, the last component's node is
+            returned. If `path_ids` is True, a (terminals, path IDs) tuple
+            is returned.
+
+        """
+        return self.compile().route(df, path_ids=path_ids)
+
+    def decode_path(self, path_id):
+        """Return the path string (as in the path column) for a path ID.
+
+        Args:
+            path_id (int): Path ID returned by `route`.
+
+        Returns:
+            str: Comma separated node IDs.
+
+        """
+        return self.compile().decode_path(path_id)
+
+    def profile(self, df, frac=None, random_state=None, detect_exclusive=False):
+        """Collect branch statistics, used to order the conditions.
+
+        Args:
+            See pandag.stats.profile
+
+        Returns:
+            dict: (src, dst) -> number of rows taking the edge.
+
+        """
+        hits = stats.profile(self, df, frac=frac, random_state=random_state,
+                             detect_exclusive=detect_exclusive)
+        # the edge order depends on the statistics
+        self._compiled = None
+        return hits
+
+    def eval_grid(self, df, param_sets):
+        """Evaluate the graph with multiple sets of parameters at once.
+
+        Args:
+            See pandag.grid.eval_grid
+
+        Returns:
+            dict: Variant key -> resulting DataFrame.
+
+        """
+        return grid.eval_grid(self, df, param_sets)
+
+    def eval_file(self, path_in, path_out, chunksize=1_000_000):
+        """Evaluate memory-mapped columnar data, chunk by chunk.
+
+        Args:
+            See pandag.columnar.eval_file
+
+        Returns:
+            None
+
+        """
+        columnar.eval_file(self, path_in, path_out, chunksize=chunksize)
+
+    def map_partitions(self, ddf):
+        """Evaluate a partitioned (Dask) DataFrame with the graph.
+
+        Args:
+            See pandag.partitioned.map_partitions
+
+        Returns:
+            dask.dataframe.DataFrame: Lazily evaluated result.
+
+        """
+        return partitioned.map_partitions(self, ddf)
 
     def draw(self, **kwargs):
         """Draw the graph.
@@ -214,4 +441,5 @@ class Pandag:
             None
 
         """
+        from pandag import plot
         plot.plot_dag(self.G, **kwargs)
@@ -0,0 +1,50 @@
+"""Evaluation of partitioned (Dask) DataFrames."""
+import pandas as pd
+
+
+def _eval_partition(df, compiled, columns, schema):
+    """Evaluate one partition and coerce it to the declared schema."""
+    res = compiled.eval(df, schema=schema)
+    return res[columns].astype(schema)
+
+
+def meta(df_meta, schema):
+    """Return an empty frame with the columns and dtypes of the result.
+
+    Args:
+        df_meta (pandas.DataFrame): Empty frame with the input schema.
+        schema (dict): Output schema, see pandag.Pandag.output_schema
+
+    Returns:
+        pandas.DataFrame: Empty frame with the output schema.
+
+    """
+    res = df_meta.copy()
+    for column, dtype in schema.items():
+        res[column] = pd.Series([], index=res.index, dtype=dtype)
+    return res
+
+
+def map_partitions(pandag, ddf):
+    """Evaluate a partitioned DataFrame partition by partition.
+
+    The output schema is derived once from the graph, so Dask doesn't have
+    to run the graph on fake data to find it, and each partition is coerced
+    to it (e.g. categoricals get the same categories everywhere). The graph
+    is compiled once and the same CompiledDag is used for all partitions,
+    the input partitions are left unmodified.
+
+    Args:
+        pandag (pandag.Pandag): The graph to evaluate.
+        ddf (dask.dataframe.DataFrame): The partitioned DataFrame.
+
+    Returns:
+        dask.dataframe.DataFrame: Lazily evaluated result.
+
+    """
+    from dask.dataframe.utils import meta_nonempty
+
+    schema = pandag.output_schema(meta_nonempty(ddf._meta))
+    res_meta = meta(ddf._meta, schema)
+    return ddf.map_partitions(_eval_partition, pandag.compile(), list(res_meta.columns),
+                              schema, meta=res_meta)
@@ -1,12 +1,18 @@
 """Plotting utilities."""
+import shutil
+from collections import OrderedDict
+
 import networkx as nx
 import matplotlib.pyplot as plt
 
-from .nodes import Node
+# layouts keyed on the graph structure, see _layout
+_layout_cache = OrderedDict()
+_layout_cache_size = 32
 
 
 def _get_node_colors(nodes, path, colors):
     """For each node, assign color based on membership in path."""
+    path = set(path)
     node_colors = []
     for x in nodes:
         if x in path:
@@ -18,7 +24,7 @@ def _get_node_colors(nodes, path, colors):
 
 def _get_edge_colors(G, path, colors):
     """For each edge, assign color based on membership in path_edges."""
-    path_edges = [(path[i], path[i + 1]) for i in range(len(path) - 1)]
+    path_edges = {(path[i], path[i + 1]) for i in range(len(path) - 1)}
     edge_colors = []
     for x in G.edges:
         if x in path_edges:
@@ -34,23 +40,87 @@ def _graphviz_layout(G):
     nx.nx_pydot.graphviz_layout() doesn't like it.
     """
     if type(G) != nx.classes.digraph.DiGraph:
-        G = nx.from_dict_of_dicts(nx.to_dict_of_dicts(G))
+        # only the structure and edge labels, without the node objects
+        H = nx.Graph()
+        H.add_nodes_from(G)
+        H.add_edges_from(G.edges(data=True))
+        G = H
     return nx.nx_pydot.graphviz_layout(G, prog='dot')
 
 
+def _coordinates_layout(G):
+    """Return the node coordinates stored in the graph (e.g. from GraphML),
+    or None if any of the nodes doesn't have them."""
+    pos = {}
+    for ix, node in G.nodes(data='node'):
+        x, y = getattr(node, '_x', None), getattr(node, '_y', None)
+        if x is None or y is None:
+            return None
+        # y grows downwards in yEd
+        pos[ix] = (x, -y)
+    return pos
+
+
+def _layered_layout(G):
+    """
+    Lay out the nodes in layers by their distance from the start nodes,
+    without running the external `dot` binary.
+    """
+    pos = {}
+    for depth, layer in enumerate(nx.topological_generations(G)):
+        for i, ix in enumerate(layer):
+            pos[ix] = (i - (len(layer) - 1) / 2, -depth)
+    return pos
+
+
+def _layout(G, layout):
+    """Return the node positions for `layout`, cached by graph structure.
+
+    `layout` is one of 'coords' (the nodes' stored coordinates), 'dot'
+    (graphviz), 'layered' or 'auto', which uses the first one available in
+    this order.
+    """
+    if layout == 'auto':
+        if _coordinates_layout(G) is not None:
+            layout = 'coords'
+        elif shutil.which('dot'):
+            layout = 'dot'
+        else:
+            layout = 'layered'
+    if layout == 'coords':
+        pos = _coordinates_layout(G)
+        assert pos is not None, "Not all nodes have coordinates"
+        return pos
+    key = (layout, tuple(G.nodes), tuple(G.edges(data='label')))
+    if key in _layout_cache:
+        _layout_cache.move_to_end(key)
+        return _layout_cache[key]
+    if layout == 'dot':
+        pos = _graphviz_layout(G)
+    elif layout == 'layered':
+        pos = _layered_layout(G)
+    else:
+        raise ValueError(f"Unknown layout: {layout}")
+    _layout_cache[key] = pos
+    if len(_layout_cache) > _layout_cache_size:
+        _layout_cache.popitem(last=False)
+    return pos
+
+
 def _draw_node_shapes(G, node_map, path, pos, colors, node_size):
     """
     Hack to draw node shapes because nx.draw() does not accept a list for
     `node_shape`.
     """
-    for node_type in Node.get_subclasses():
-        node_list = {ix for ix, node in node_map.items()
-                     if isinstance(node, node_type)}
+    shapes = {}
+    for ix, node in node_map.items():
+        shapes.setdefault(node.plot_shape, []).append(ix)
+    for plot_shape, node_list in shapes.items():
         node_colors = _get_node_colors(node_list, path, colors)
         nx.draw_networkx_nodes(
             G,
             pos,
-            node_shape=node_type.plot_shape,
+            node_shape=plot_shape,
             node_size=node_size,
             node_color=node_colors,
             nodelist=node_list,
@@ -58,7 +128,8 @@ def _draw_node_shapes(G, node_map, path, pos, colors, node_size):
 
 
 # TODO: add legend for active vs. inactive node colors
-def plot_dag(G, title=None, show_ids=False, path=None, pos=None, figsize=(20, 24), fpath=None):
+def plot_dag(G, title=None, show_ids=False, path=None, pos=None, figsize=(20, 24), fpath=None,
+             layout='auto'):
     """
     Generate Matplotlib rendering of graph structure.
 
@@ -69,6 +140,9 @@ def plot_dag(G, title=None, show_ids=False, path=None, pos=None, figsize=(20, 24
         pos: map of node indices to (x, y) coordinates for the plot
         figsize: figure size
         fpath: file path to save plot
+        layout: how to compute `pos` if not given: 'coords' (GraphML
+            coordinates), 'dot' (graphviz), 'layered' (in-process) or
+            'auto' (the first one available)
     """
     colors = {
         'active': 'lightskyblue',
@@ -81,7 +155,7 @@ def plot_dag(G, title=None, show_ids=False, path=None, pos=None, figsize=(20, 24
     plt.figure(figsize=figsize)
     plt.title(title)
 
-    pos = pos or _graphviz_layout(G)
+    pos = pos or _layout(G, layout)
 
     node_map = {ix: data['node'] for ix, data in G.nodes(data=True)}
 
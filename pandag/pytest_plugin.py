@@ -0,0 +1,56 @@
+"""pytest plugin for differential testing of the evaluation engines.
+
+Enable it with ``-p pandag.pytest_plugin``, or ``pytest_plugins =
+['pandag.pytest_plugin']`` in a conftest.py. It provides:
+
+- the `differential` fixture, a function checking that all engines agree
+  on a graph and a frame (see pandag.testing.check),
+- the `pandag_seed` argument, tests using it run once for each random graph
+  seed (see the --pandag-dags and --pandag-seed options),
+- a summary of the time spent in each engine.
+"""
+import pytest
+
+from pandag import testing
+
+
+def pytest_addoption(parser):
+    group = parser.getgroup('pandag')
+    group.addoption('--pandag-dags', type=int, default=3,
+                    help="number of random graphs for tests using pandag_seed")
+    group.addoption('--pandag-seed', type=int, default=0,
+                    help="seed of the first random graph")
+
+
+def pytest_generate_tests(metafunc):
+    if 'pandag_seed' in metafunc.fixturenames:
+        first = metafunc.config.getoption('pandag_seed')
+        count = metafunc.config.getoption('pandag_dags')
+        metafunc.parametrize('pandag_seed', range(first, first + count))
+
+
+@pytest.fixture
+def differential(request):
+    """Return a function asserting that all engines agree.
+
+    It takes the same arguments as pandag.testing.check, the engines'
+    timings are recorded in the test report."""
+    def check(pandag, df, **kwargs):
+        results = testing.check(pandag, df, **kwargs)
+        for name, result in results.items():
+            request.node.user_properties.append((f'pandag:{name}', result['seconds']))
+        return results
+    return check
+
+
+def pytest_terminal_summary(terminalreporter):
+    totals = {}
+    for reports in terminalreporter.stats.values():
+        for report in reports:
+            for key, seconds in getattr(report, 'user_properties', ()):
+                if isinstance(key, str) and key.startswith('pandag:'):
+                    totals[key[7:]] = totals.get(key[7:], 0) + seconds
+    if totals:
+        terminalreporter.write_sep('-', 'pandag engine timings')
+        for name, seconds in totals.items():
+            terminalreporter.write_line(f'{name}: {seconds:.3f}s')
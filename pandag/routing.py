@@ -0,0 +1,164 @@
+"""Routing helpers: path numbering and output dependencies.
+
+Paths are numbered with the Ball-Larus scheme: each edge gets an increment,
+so that summing the increments along the edges a row takes gives a unique
+ID in `[0, number of paths)` for each path from the start node. Rows can
+stop at any node (end nodes or nodes where no condition matched), which is
+counted as an extra path with a zero increment. With multiple start nodes
+the components' IDs are combined as digits of a mixed radix number.
+"""
+import numpy as np
+
+from .nodes import Inequal, Output, expr_names
+
+
+def number_paths(components):
+    """Number the paths of each component.
+
+    Args:
+        components (list): (start node ID, steps) tuples of a compiled
+            graph, see pandag.runtime.CompiledDag
+
+    Returns:
+        list: Path numbering for each component.
+
+    """
+    numbering = []
+    radix = 1
+    for start, steps in components:
+        num_paths = {}
+        edges = {}
+        for node_id, _, node_edges in reversed(steps):
+            # stopping at the node is path 0
+            count = 1
+            edges[node_id] = []
+            for dst, data in node_edges:
+                edges[node_id].append((dst, count, data.get('hops', [dst])))
+                count += num_paths[dst]
+            num_paths[node_id] = count
+        numbering.append({
+            'start': start,
+            'radix': radix,
+            'num_paths': num_paths,
+            'edges': edges,
+            'increments': {(node_id, dst): increment * radix
+                           for node_id, node_edges in edges.items()
+                           for dst, increment, _ in node_edges},
+        })
+        radix *= num_paths[start]
+    return numbering
+
+
+def path_id_dtype(numbering):
+    """Return the smallest integer dtype which can hold all path IDs."""
+    total = 1
+    for component in numbering:
+        total *= component['num_paths'][component['start']]
+    if total > np.iinfo(np.uint64).max:
+        raise ValueError(f"The graph has too many paths ({total}) to number them")
+    return np.min_scalar_type(total - 1)
+
+
+def edge_increment(numbering, component, src, dst):
+    """Return the path ID increment of an edge in a component."""
+    return numbering[component]['increments'][(src, dst)]
+
+
+def decode_path(numbering, path_id):
+    """Return the path string for a path ID.
+
+    Args:
+        numbering (list): Path numbering, see `number_paths`.
+        path_id (int): The path ID.
+
+    Returns:
+        str: Comma separated node IDs, as in the path column.
+
+    """
+    path_id = int(path_id)
+    parts = []
+    for component in numbering:
+        num_paths = component['num_paths']
+        node_id = component['start']
+        rest = (path_id // component['radix']) % num_paths[node_id]
+        parts.append(str(node_id))
+        while rest:
+            for dst, increment, hops in component['edges'][node_id]:
+                if increment <= rest < increment + num_paths[dst]:
+                    rest -= increment
+                    parts.extend(str(hop) for hop in hops)
+                    node_id = dst
+                    break
+    return ','.join(parts)
+
+
+def max_path_length(components):
+    """Return the length of the longest path string.
+
+    Args:
+        components (list): (start node ID, steps) tuples of a compiled
+            graph, see pandag.runtime.CompiledDag
+
+    Returns:
+        int: Number of characters, as in the path column.
+
+    """
+    lengths = []
+    for start, steps in components:
+        # characters a path appends after each node
+        longest = {}
+        for node_id, _, node_edges in reversed(steps):
+            longest[node_id] = max(
+                [sum(len(str(hop)) + 1 for hop in data.get('hops', [dst])) + longest[dst]
+                 for dst, data in node_edges],
+                default=0)
+        lengths.append(len(str(start)) + longest[start])
+    # the components' paths are joined with commas
+    return sum(lengths) + len(lengths) - 1
+
+
+def needed_outputs(components):
+    """Return the Output nodes which conditions depend on.
+
+    Args:
+        components (list): (start node ID, steps) tuples of a compiled
+            graph, see pandag.runtime.CompiledDag
+
+    Returns:
+        set: IDs of the Output nodes writing columns read by conditions
+        (directly or through other needed Output nodes), or None if all of
+        them may be needed.
+
+    """
+    steps = {node_id: (node, edges)
+             for _, component_steps in components
+             for node_id, node, edges in component_steps}
+    names = set()
+    for node, edges in steps.values():
+        if isinstance(node, Output):
+            continue
+        node_names = node.names()
+        if node_names is None:
+            return None
+        names |= node_names
+        if isinstance(node, Inequal):
+            for _, data in edges:
+                if isinstance(data.get('label'), str) and not data.get('always'):
+                    names |= expr_names(data['label'])
+    needed = set()
+    changed = True
+    while changed:
+        changed = False
+        for node_id, (node, _) in steps.items():
+            if not isinstance(node, Output) or node_id in needed:
+                continue
+            columns = node.columns()
+            if columns is not None and names.isdisjoint(columns):
+                continue
+            node_names = node.names()
+            if node_names is None:
+                return None
+            needed.add(node_id)
+            names |= node_names
+            changed = True
+    return needed
@@ -0,0 +1,362 @@
+"""Evaluation runtime.
+
+The runtime works on a compiled form of the graph (see `Pandag.compile`): a
+list of the nodes to visit for each start node, in topological order, with
+their outgoing edges. It only needs numpy and pandas, so a pickled
+CompiledDag can be loaded and evaluated without importing networkx or
+matplotlib.
+"""
+import pickle
+
+import numpy as np
+import pandas as pd
+
+from . import routing
+from .buffer import WriteBuffer
+from .nodes import Assert, Inequal, Output, expr_elementwise, expr_local_names, expr_names
+
+# elementwise conditions of nodes reached by at most this fraction of the
+# rows are evaluated on those rows only
+SUBSET_FRACTION = 0.25
+
+
+def _value_dtype(value):
+    """Return the dtype a node output value is stored with."""
+    if isinstance(value, str):
+        return pd.CategoricalDtype([value])
+    if isinstance(value, pd.Series):
+        return value.dtype
+    return np.asarray(value).dtype
+
+
+def _merge_dtypes(a, b):
+    """Return a dtype which can hold values of both `a` and `b`."""
+    if a is None or a == b:
+        return b
+    if isinstance(a, pd.CategoricalDtype) and isinstance(b, pd.CategoricalDtype):
+        categories = list(a.categories)
+        categories.extend(c for c in b.categories if c not in a.categories)
+        return pd.CategoricalDtype(categories)
+    if (isinstance(a, np.dtype) and isinstance(b, np.dtype)
+            and a.kind in 'iuf' and b.kind in 'iuf'):
+        return np.promote_types(a, b)
+    return np.dtype(object)
+
+
+def output_schema(outputs, sample, path_column=None, promote=True):
+    """Derive the dtypes of the columns written by Output nodes.
+
+    The Output nodes' expressions are evaluated on `sample` (a small,
+    non-empty frame with the input's dtypes), so the schema doesn't
+    depend on which rows end up reaching which node. Columns not present
+    in the input are assumed to be partially filled, so integers become
+    float64 and booleans object, as with the missing values pandas
+    inserts.
+
+    Args:
+        outputs (list): Output nodes, in topological order.
+        sample (pandas.DataFrame): Non-empty frame with the input columns.
+        path_column (str): Name of the path column, if any.
+        promote (bool): Promote the dtypes of new columns to hold missing
+            values. If False, the dtypes of the written values are returned.
+
+    Returns:
+        dict: Column name -> dtype, in output column order.
+
+    """
+    input_columns = set(sample.columns)
+    sample = sample.copy()
+    schema = {}
+    for node in outputs:
+        for column, value in list(node.assignments(sample)):
+            dtype = _value_dtype(value)
+            if column not in schema:
+                schema[column] = sample[column].dtype if column in sample else None
+            schema[column] = _merge_dtypes(schema[column], dtype)
+            # later nodes may read this column
+            sample[column] = value
+    for column, dtype in schema.items():
+        if not promote or column in input_columns or not isinstance(dtype, np.dtype):
+            continue
+        if dtype.kind in 'iu':
+            schema[column] = np.dtype(float)
+        elif dtype.kind == 'b':
+            schema[column] = np.dtype(object)
+    if path_column:
+        schema[path_column] = np.dtype(object)
+    return schema
+
+
+def _condition_expr(node, edge_data):
+    """Return the expression of an edge condition, or None."""
+    if isinstance(node, Assert):
+        return node.query
+    if isinstance(node, Inequal) and isinstance(edge_data.get('label'), str):
+        return edge_data['label']
+    return None
+
+
+def _scalar_param(value):
+    if isinstance(value, (list, tuple, set, frozenset)):
+        return all(pd.api.types.is_scalar(v) for v in value)
+    return pd.api.types.is_scalar(value)
+
+
+def subsettable(node, edge_data):
+    """Return True if an edge condition can be evaluated on a subset of rows.
+
+    The condition has to be elementwise (see pandag.nodes.expr_elementwise)
+    and its `@` parameters scalars (or lists of them for `in`)."""
+    expr = _condition_expr(node, edge_data)
+    if expr is None or not expr_elementwise(expr):
+        return False
+    local_dict = node.local_dict or {}
+    global_dict = node.global_dict or {}
+    for name in expr_local_names(expr):
+        scope = local_dict if name in local_dict else global_dict
+        if name not in scope or not _scalar_param(scope[name]):
+            return False
+    return True
+
+
+def _condition(df, node, edge_data, at_node, buffer, subset=False):
+    """Evaluate an edge condition for the rows at the node.
+
+    If `subset` is True (see `subsettable`) and only a few rows reached the
+    node, the condition is evaluated on a copy of those rows (and of the
+    columns it reads) only."""
+    if not subset or np.count_nonzero(at_node) > len(df) * SUBSET_FRACTION:
+        res = node.eval(df, edge_data, resolvers=(buffer.resolver(),))
+        return at_node & np.asarray(res, dtype=bool)
+    names = expr_names(_condition_expr(node, edge_data))
+    columns = [c for c in df.columns if c in names]
+    res = node.eval(df.loc[at_node, columns], edge_data, resolvers=(buffer.resolver(at_node),))
+    flt = np.zeros(len(df), dtype=bool)
+    flt[at_node] = np.asarray(res, dtype=bool)
+    return flt
+
+
+class CompiledDag:
+    """CompiledDag evaluates a graph without networkx."""
+
+    def __init__(self, node_ids, components, outputs, path_column='path'):
+        """
+        Args:
+            node_ids (list): All node IDs, their index is the node's position.
+            components (list): (start node ID, steps) tuples, where steps is
+                a list of (node ID, node, [(dst node ID, edge data)]) in
+                topological order.
+            outputs (list): Output nodes in topological order, for the
+                output schema.
+            path_column (str): Name of the path column, None to skip it.
+
+        """
+        self.node_ids = node_ids
+        self.positions = {node_id: pos for pos, node_id in enumerate(node_ids)}
+        self.components = components
+        self.outputs = outputs
+        self.path_column = path_column
+        # computed on first use by route and decode_path
+        self._numbering = None
+        self._needed = None
+        # edges whose conditions can be evaluated on the rows at the node only
+        self.subsets = {(node_id, dst) for _, steps in components
+                        for node_id, node, edges in steps
+                        for dst, data in edges if subsettable(node, data)}
+
+    def output_schema(self, sample):
+        """Derive the dtypes of the columns written by the graph.
+
+        See pandag.runtime.output_schema
+
+        """
+        return output_schema(self.outputs, sample, self.path_column)
+
+    def _evaluate(self, df, outputs=None, paths=True, numbering=None,
+                  schema=None, masks=None, hits=None, overlaps=None):
+        """Move the rows of `df` through the graph.
+
+        Args:
+            df (pandas.DataFrame): The DataFrame to be evaluated.
+            outputs (set): IDs of the Output nodes to apply, None for all.
+            paths (bool): Build the path strings.
+            numbering (list): Path numbering (see pandag.routing) to compute
+                path IDs with, or None.
+            schema (dict): Output schema, derived from `df` if None.
+            masks (dict): Precomputed conditions, (src, dst) -> bool array.
+            hits (dict): If given, the number of rows taking each edge is
+                added to it, (src, dst) -> count.
+            overlaps (dict): If given, the number of rows matching more than
+                one condition of each Inequal node is added to it, node ID
+                -> count.
+
+        Returns:
+            tuple: The write buffer, the rows' final node positions, the path
+            strings (or None) and the path IDs (or None).
+
+        """
+        # Output nodes' updates are collected in a write buffer and applied
+        # to the result at once, the input isn't modified
+        if schema is None:
+            schema = self.output_schema(df.head(1))
+        buffer = WriteBuffer(df, schema)
+        # track the current node of each row by its dense position, using the
+        # smallest integer type which can hold all of them
+        positions = self.positions
+        curr_node = np.zeros(len(df), dtype=np.min_scalar_type(len(positions)))
+        component_paths = []
+        path_ids = None
+        if numbering is not None:
+            path_ids = np.zeros(len(df), dtype=routing.path_id_dtype(numbering))
+        for k, (start, steps) in enumerate(self.components):
+            # every row starts from each start node, the components are
+            # evaluated one after the other
+            curr_node[:] = positions[start]
+            if paths:
+                path = np.full(len(df), str(start), dtype=object)
+            for node_id, node, edges in steps:
+                if not edges:
+                    # end node, nothing to do
+                    continue
+                at_node = (curr_node == positions[node_id])
+                if not at_node.any():
+                    continue
+                # expressions see the columns written by upstream nodes
+                if isinstance(node, Output) and (outputs is None or node_id in outputs):
+                    for column, value in node.assignments(df, resolvers=(buffer.resolver(),)):
+                        buffer.record(at_node, column, value)
+                if overlaps is not None and isinstance(node, Inequal):
+                    matches = sum(_condition(df, node, edge_data, at_node, buffer,
+                                             (node_id, dst) in self.subsets).astype(np.int64)
+                                  for dst, edge_data in edges if not edge_data.get('always'))
+                    overlaps[node_id] = (overlaps.get(node_id, 0)
+                                         + int(np.count_nonzero(np.asarray(matches) > 1)))
+                # move the matching rows along the outgoing edges, the first
+                # matching edge wins
+                for dst_node_id, edge_data in edges:
+                    if edge_data.get('always'):
+                        flt = at_node.copy()
+                    elif masks and (node_id, dst_node_id) in masks:
+                        flt = at_node & masks[(node_id, dst_node_id)]
+                    else:
+                        flt = _condition(df, node, edge_data, at_node, buffer,
+                                         (node_id, dst_node_id) in self.subsets)
+                    curr_node[flt] = positions[dst_node_id]
+                    if hits is not None:
+                        key = (node_id, dst_node_id)
+                        hits[key] = hits.get(key, 0) + int(np.count_nonzero(flt))
+                    if paths:
+                        # store the path which touched these rows, optimised
+                        # edges can stand for multiple original ones
+                        hops = edge_data.get('hops', [dst_node_id])
+                        path[flt] = path[flt] + ''.join(f',{hop}' for hop in hops)
+                    if path_ids is not None:
+                        path_ids[flt] += routing.edge_increment(numbering, k, node_id,
+                                                                dst_node_id)
+                    at_node &= ~flt
+                    if not at_node.any():
+                        break
+            if paths:
+                component_paths.append(path)
+
+        path = None
+        if component_paths:
+            # join the components' paths in evaluation order
+            path = component_paths[0]
+            for component_path in component_paths[1:]:
+                path = path + ',' + component_path
+        return buffer, curr_node, path, path_ids
+
+    def eval(self, df, schema=None):
+        """Evaluate a Pandas DataFrame with the graph.
+
+        Args:
+            df (pandas.DataFrame): The DataFrame to be evaluated.
+            schema (dict): Output schema (see `output_schema`), derived from
+                `df` if None.
+
+        Returns:
+            pandas.DataFrame: Resulting DataFrame.
+
+        """
+        res = df.copy(deep=False)
+        for column, values in self.written_columns(df, schema=schema).items():
+            res[column] = values
+        return res
+
+    def written_columns(self, df, schema=None, masks=None):
+        """Evaluate `df` and return only the columns written by the graph.
+
+        Args:
+            df (pandas.DataFrame): The DataFrame to be evaluated.
+            schema (dict): Output schema, derived from `df` if None.
+            masks (dict): Precomputed conditions, see `_evaluate`.
+
+        Returns:
+            dict: Column name -> Series, including the path column.
+
+        """
+        buffer, _, path, _ = self._evaluate(df, paths=bool(self.path_column), schema=schema,
+                                            masks=masks)
+        columns = buffer.columns()
+        if path is not None:
+            columns[self.path_column] = pd.Series(path, index=df.index, name=self.path_column)
+        return columns
+
+    def route(self, df, path_ids=False):
+        """Return the node each row ends up in, without applying the outputs.
+
+        See pandag.Pandag.route
+
+        """
+        if self._needed is None:
+            self._needed = routing.needed_outputs(self.components)
+        needed = self._needed
+        # only the needed Output nodes are evaluated for the schema too
+        outputs = []
+        for _, steps in self.components:
+            outputs.extend(node for node_id, node, _ in steps
+                           if isinstance(node, Output) and (needed is None or node_id in needed)
+                           and node not in outputs)
+        schema = output_schema(outputs, df.head(1))
+        numbering = self.numbering() if path_ids else None
+        _, curr_node, _, ids = self._evaluate(df, outputs=needed, paths=False,
+                                              numbering=numbering, schema=schema)
+        terminals = pd.Categorical.from_codes(curr_node.astype(np.int64, copy=False),
+                                              categories=self.node_ids)
+        if path_ids:
+            return terminals, ids
+        return terminals
+
+    def decode_path(self, path_id):
+        """Return the path string (as in the path column) for a path ID.
+
+        See pandag.Pandag.decode_path
+
+        """
+        return routing.decode_path(self.numbering(), path_id)
+
+    def numbering(self):
+        """Return the path numbering of the graph, see pandag.routing."""
+        if self._numbering is None:
+            self._numbering = routing.number_paths(self.components)
+        return self._numbering
+
+    def save(self, path):
+        """Save the compiled graph to `path`, see `load`."""
+        with open(path, 'wb') as f:
+            pickle.dump(self, f)
+
+
+def load(path):
+    """Load a compiled graph saved with CompiledDag.save.
+
+    Args:
+        path (str): File path.
+
+    Returns:
+        pandag.runtime.CompiledDag: The compiled graph.
+
+    """
+    with open(path, 'rb') as f:
+        return pickle.load(f)
@@ -0,0 +1,86 @@
+"""Branch statistics and edge ordering.
+
+`profile` counts how many rows take each edge (optionally on a sample of the
+data) and stores the counts in the graph as the `hits` edge attribute.
+When compiling, the edges of nodes whose conditions are mutually exclusive
+are ordered by them, so the most likely branch is tested first and the
+others only on the remaining rows:
+
+- the two edges of an Assert node are complementary, the second one just
+  takes the rows left by the first,
+- Inequal nodes marked `exclusive` have their conditions tested in order of
+  decreasing hits.
+"""
+from . import routing
+from .nodes import Assert, Inequal
+
+
+def _hits(edge):
+    return -edge[1].get('hits', 0)
+
+
+def order_edges(node, edges):
+    """Return the outgoing edges of a node in evaluation order.
+
+    Args:
+        node (pandag.Node): The source node.
+        edges (list): (dst node ID, edge data) tuples, in graph order.
+
+    Returns:
+        list: (dst node ID, edge data) tuples, the edge data is copied if
+        it's modified.
+
+    """
+    if any(data.get('always') for _, data in edges):
+        return edges
+    if (isinstance(node, Assert) and len(edges) == 2
+            and {bool(data.get('label')) for _, data in edges} == {True, False}):
+        first, second = sorted(edges, key=_hits)
+        return [first, (second[0], dict(second[1], always=True))]
+    if isinstance(node, Inequal) and node.exclusive:
+        return sorted(edges, key=_hits)
+    return edges
+
+
+def profile(pandag, df, frac=None, random_state=None, detect_exclusive=False):
+    """Count the rows taking each edge of the graph.
+
+    The counts are stored as the `hits` attribute of the evaluated graph's
+    edges (and of the original graph's, if it's optimised), and used by
+    `Pandag.compile` to order the edges. The number of rows matching more
+    than one condition of an Inequal node is stored as its `overlaps`
+    attribute.
+
+    Args:
+        pandag (pandag.Pandag): The graph to profile.
+        df (pandas.DataFrame): Representative data.
+        frac (float): Fraction of `df` to sample, None to use all rows.
+        random_state (int): Seed for the sample.
+        detect_exclusive (bool): Mark Inequal nodes without an explicit
+            `exclusive` setting as exclusive if none of the rows matched
+            more than one of their conditions. This is only safe if the
+            sample covers all the cases.
+
+    Returns:
+        dict: (src, dst) -> number of rows.
+
+    """
+    if frac is not None:
+        df = df.sample(frac=frac, random_state=random_state)
+    compiled = pandag.compile()
+    hits = {}
+    overlaps = {}
+    compiled._evaluate(df, outputs=routing.needed_outputs(compiled.components),
+                       paths=False, hits=hits, overlaps=overlaps)
+    G = pandag.eval_graph()
+    for src, dst, data in G.edges(data=True):
+        count = hits.get((src, dst), 0)
+        data['hits'] = count
+        if G is not pandag.G and pandag.G.has_edge(src, dst):
+            pandag.G.edges[src, dst]['hits'] = count
+    for node_id, count in overlaps.items():
+        G.nodes[node_id]['overlaps'] = count
+        node = G.nodes[node_id]['node']
+        if detect_exclusive and node.exclusive is None:
+            node.exclusive = count == 0
+    return hits
@@ -0,0 +1,435 @@
+"""Differential testing of the evaluation engines.
+
+Random graphs (Assert, Inequal, Output and Dummy nodes, with diamonds and
+multiple start nodes) and random frames are evaluated with `Pandag.eval`
+and with each alternative engine or mode, and the results (written columns
+and the path column) are compared row by row. The `reference` engine walks
+each row through the original graph one at a time, independently of the
+vectorised runtime. The columns and dtypes of each result are checked
+against the graph's output schema as well.
+
+See pandag.pytest_plugin for using it from tests.
+"""
+import copy
+import pickle
+import random
+import tempfile
+import time
+
+import networkx as nx
+import numpy as np
+import pandas as pd
+
+from .cache import ResultCache
+from .nodes import Assert, Dummy, Inequal, Output, expr_elementwise, expr_local_names
+from .pandag import Pandag
+
+# input columns of the random frames
+COLUMNS = ['a', 'b', 'c']
+
+
+def random_frame(seed, n_rows=50):
+    """Return a random frame for the random graphs.
+
+    `a` and `b` are integers, `c` is a float column with missing values.
+    The index is shuffled, so results relying on positional alignment show
+    up as differences.
+    """
+    rng = np.random.default_rng(seed)
+    df = pd.DataFrame({'a': rng.integers(0, 100, n_rows),
+                       'b': rng.integers(0, 100, n_rows),
+                       'c': rng.uniform(0, 100, n_rows)},
+                      index=rng.permutation(n_rows) * 3)
+    df.loc[rng.random(n_rows) < 0.1, 'c'] = np.nan
+    return df
+
+
+def _condition(rng):
+    if rng.random() < 0.1:
+        # reads other rows too
+        column = rng.choice(COLUMNS)
+        return f'{column} > {column}.mean()'
+    column = rng.choice(COLUMNS + ['index'])
+    op = rng.choice(['<', '>=', '>', '<=', '=='])
+    value = rng.choice(['@limit', str(rng.randrange(100))])
+    if rng.random() < 0.2:
+        return f'{column} {op} {value} and {rng.choice(COLUMNS)} < {rng.randrange(100)}'
+    return f'{column} {op} {value}'
+
+
+def _output(rng):
+    assignments = {}
+    for _ in range(rng.randint(1, 2)):
+        if rng.random() < 0.5:
+            assignments[f'o{rng.randrange(2)}'] = rng.choice(
+                [f'{rng.choice(COLUMNS)} * {rng.randint(1, 3)}',
+                 f'{rng.choice(COLUMNS)} + @limit', str(rng.randrange(10))])
+        else:
+            assignments[f's{rng.randrange(2)}'] = f'"v{rng.randrange(3)}"'
+    if rng.random() < 0.5:
+        return Output(expr='\n'.join(f'{k} = {v}' for k, v in assignments.items()))
+    return Output(**assignments)
+
+
+def random_dag(seed, n_nodes=12, path_column='path'):
+    """Return a random graph reading the columns of `random_frame`.
+
+    Args:
+        seed (int): Random seed.
+        n_nodes (int): Number of nodes.
+        path_column (str): Path column of the graph.
+
+    Returns:
+        pandag.Pandag: The graph, nodes without incoming edges are start
+        nodes.
+
+    """
+    rng = random.Random(seed)
+    local_dict = {'limit': rng.randrange(100)}
+    dag = Pandag(path_column=path_column)
+    nodes = []
+    for _ in range(n_nodes):
+        kind = rng.choices([Assert, Inequal, Output, Dummy], weights=[3, 2, 3, 1])[0]
+        if kind is Assert:
+            node = Assert(_condition(rng))
+        elif kind is Inequal:
+            node = Inequal()
+        elif kind is Output:
+            node = _output(rng)
+        else:
+            node = Dummy()
+        if hasattr(node, 'local_dict'):
+            node.local_dict = local_dict
+        dag.get_node_id(node)
+        nodes.append(node)
+
+    orphans = set(range(1, n_nodes))
+    for i, node in enumerate(nodes):
+        later = list(range(i + 1, n_nodes))
+        if isinstance(node, Assert):
+            count = 2
+        elif isinstance(node, Inequal):
+            count = rng.randint(2, 3)
+        else:
+            count = 1 if rng.random() < 0.85 else 0
+        if len(later) < count:
+            # not enough nodes left, the node becomes an end node
+            continue
+        # prefer nodes without parents, so there are few start nodes
+        children = sorted(orphans & set(later))[:count]
+        children += rng.sample([j for j in later if j not in children], count - len(children))
+        for j, child in enumerate(children):
+            label = None
+            if isinstance(node, Assert):
+                label = j == 0
+            elif isinstance(node, Inequal):
+                label = _condition(rng)
+            dag.G.add_edge(dag.get_node_id(node), dag.get_node_id(nodes[child]), label=label)
+            orphans.discard(child)
+    return dag
+
+
+def _mask(res, n):
+    return np.broadcast_to(np.asarray(res, dtype=bool), (n,))
+
+
+def _condition_expr(node, edge_data):
+    if isinstance(node, Assert):
+        return node.query
+    if isinstance(node, Inequal) and isinstance(edge_data.get('label'), str):
+        return edge_data['label']
+    return None
+
+
+def reference_eval(pandag, df):
+    """Evaluate `df` by walking each row through the graph on its own.
+
+    Conditions reading other rows (see pandag.nodes.expr_elementwise) are
+    evaluated on the whole input frame, so they may only read input
+    columns.
+
+    Args:
+        pandag (pandag.Pandag): The graph.
+        df (pandas.DataFrame): The DataFrame to be evaluated.
+
+    Returns:
+        pandas.DataFrame: Resulting DataFrame, with the same values as
+        `pandag.eval(df)`, but not necessarily the same dtypes.
+
+    """
+    G = pandag.G
+    starts = [start for start in pandag.start_nodes() if G.out_degree(start)]
+    # columns of the applied Output nodes are created even if no row
+    # reaches them
+    written = {}
+    for node_id in nx.topological_sort(G):
+        node = G.nodes[node_id]['node']
+        if isinstance(node, Output) and G.out_degree(node_id):
+            for column in node.columns() or []:
+                written.setdefault(column, {})
+    paths = []
+    # results of the conditions reading other rows, (src, dst) -> mask
+    cross_row = {}
+    for pos in range(len(df)):
+        row = df.iloc[[pos]].copy()
+        parts = []
+        for start in starts:
+            node_id = start
+            path = [start]
+            while True:
+                node = G.nodes[node_id]['node']
+                edges = list(G.out_edges(node_id, data=True))
+                if not edges:
+                    break
+                if isinstance(node, Output):
+                    for column, value in list(node.assignments(row)):
+                        row[column] = value
+                        written.setdefault(column, {})
+                for _, dst, data in edges:
+                    expr = _condition_expr(node, data)
+                    if expr is not None and not expr_elementwise(expr):
+                        if (node_id, dst) not in cross_row:
+                            cross_row[(node_id, dst)] = _mask(node.eval(df, data), len(df))
+                        matched = cross_row[(node_id, dst)][pos]
+                    else:
+                        matched = _mask(node.eval(row, data), 1)[0]
+                    if matched:
+                        node_id = dst
+                        path.append(dst)
+                        break
+                else:
+                    break
+            parts.extend(str(node_id) for node_id in path)
+        for column, values in written.items():
+            if column in row:
+                values[pos] = row[column].iloc[0]
+        paths.append(','.join(parts))
+
+    res = df.copy()
+    for column, values in written.items():
+        res[column] = pd.Series([values.get(pos, np.nan) for pos in range(len(df))],
+                                index=df.index, dtype=object)
+    if pandag.path_column:
+        res[pandag.path_column] = paths
+    return res
+
+
+def _optimized(pandag, df):
+    dag = copy.deepcopy(pandag)
+    dag.optimize()
+    return dag.eval(df), None
+
+
+def _compiled(pandag, df):
+    compiled = pickle.loads(pickle.dumps(pandag.compile()))
+    return compiled.eval(df), None
+
+
+def _with_params(pandag, params):
+    """Return a copy of `pandag` with updated `local_dict` parameters."""
+    dag = copy.deepcopy(pandag)
+    local_dicts = {}
+    for node in dag.node_ids.values():
+        if getattr(node, 'local_dict', None) is not None:
+            key = id(node.local_dict)
+            if key not in local_dicts:
+                local_dicts[key] = {**node.local_dict, **params}
+            node.local_dict = local_dicts[key]
+    if dag.plan is not None:
+        dag.optimize()
+    dag.invalidate()
+    return dag
+
+
+def _param_variants(pandag):
+    """Return two parameter sets, changing the numeric `@` parameters."""
+    params = {}
+    for node_id, node in pandag.node_ids.items():
+        local_dict = getattr(node, 'local_dict', None) or {}
+        exprs = [getattr(node, 'query', None), getattr(node, 'expr', None),
+                 *getattr(node, 'kw', {}).values(),
+                 *(label for _, _, label in pandag.G.out_edges(node_id, data='label'))]
+        for expr in exprs:
+            if not isinstance(expr, str):
+                continue
+            for name in expr_local_names(expr):
+                value = local_dict.get(name)
+                if isinstance(value, (int, float)) and not isinstance(value, bool):
+                    params[name] = value
+    return ({name: value * 0.5 for name, value in params.items()},
+            {name: value * 1.5 + 1 for name, value in params.items()})
+
+
+def _grid(pandag, df):
+    """Evaluate the graph's parameters between two other variants.
+
+    The other variants are checked against evaluating the graph loaded with
+    their parameters."""
+    low, high = _param_variants(pandag)
+    results = pandag.eval_grid(df, {'low': low, 'base': {}, 'high': high})
+    for key, params in (('low', low), ('high', high)):
+        diff = diff_frames(_with_params(pandag, params).eval(df), results[key])
+        assert diff.empty, f"grid variant {params}:\n{diff.head(10).to_string()}"
+    return results['base'], None
+
+
+def _route(pandag, df):
+    _, path_ids = pandag.route(df, path_ids=True)
+    compiled = pandag.compile()
+    paths = [compiled.decode_path(path_id) for path_id in path_ids]
+    return pd.DataFrame({pandag.path_column: paths}, index=df.index), [pandag.path_column]
+
+
+def _profiled(pandag, df):
+    dag = copy.deepcopy(pandag)
+    dag.profile(df, detect_exclusive=True)
+    return dag.eval(df), None
+
+
+def _cached(pandag, df):
+    with tempfile.TemporaryDirectory() as path:
+        cache = ResultCache(path)
+        pandag.eval(df, cache=cache)
+        return pandag.eval(df, cache=cache), None
+
+
+# name -> function returning the result and the columns to compare (None for
+# all of them)
+ENGINES = {
+    'eval': lambda pandag, df: (pandag.eval(df), None),
+    'reference': lambda pandag, df: (reference_eval(pandag, df), None),
+    'optimize': _optimized,
+    'compiled': _compiled,
+    'grid': _grid,
+    'route': _route,
+    'profiled': _profiled,
+    'cached': _cached,
+}
+
+
+def _same(a, b):
+    if pd.api.types.is_scalar(a) and pd.api.types.is_scalar(b) and pd.isna(a) and pd.isna(b):
+        return True
+    if (isinstance(a, (int, float, np.number)) and isinstance(b, (int, float, np.number))
+            and not isinstance(a, (bool, np.bool_)) and not isinstance(b, (bool, np.bool_))):
+        return bool(np.isclose(a, b))
+    return bool(a == b)
+
+
+def diff_frames(expected, actual, columns=None):
+    """Compare two results row by row.
+
+    Args:
+        expected (pandas.DataFrame): Expected result.
+        actual (pandas.DataFrame): Actual result.
+        columns (list): Columns to compare, None for all of `expected`'s.
+
+    Returns:
+        pandas.DataFrame: The differing values, with row (index label),
+        column, expected and actual columns. Missing columns have a row
+        of None.
+
+    """
+    diffs = []
+    if columns is None:
+        columns = list(expected.columns)
+        diffs.extend((None, column, None, column) for column in actual.columns
+                     if column not in expected)
+    for column in columns:
+        if column not in actual:
+            diffs.append((None, column, column, None))
+            continue
+        for label, a, b in zip(expected.index, expected[column].astype(object),
+                               actual[column].astype(object)):
+            if not _same(a, b):
+                diffs.append((label, column, a, b))
+    if not expected.index.equals(actual.index):
+        diffs.append((None, 'index', None, None))
+    return pd.DataFrame(diffs, columns=['row', 'column', 'expected', 'actual'])
+
+
+def diff_schema(schema, df, res, dtypes=True):
+    """Compare the columns (and dtypes) of a result to the output schema.
+
+    Args:
+        schema (dict): Output schema, see pandag.Pandag.output_schema
+        df (pandas.DataFrame): The evaluated frame.
+        res (pandas.DataFrame): The result.
+        dtypes (bool): Compare the dtypes too.
+
+    Returns:
+        list: (row, column, expected, actual) tuples, see `diff_frames`.
+
+    """
+    diffs = []
+    columns = list(df.columns) + [c for c in schema if c not in df.columns]
+    if list(res.columns) != columns:
+        diffs.append((None, 'columns', columns, list(res.columns)))
+    if dtypes:
+        diffs.extend((None, column, dtype, res[column].dtype)
+                     for column, dtype in schema.items()
+                     if column in res and res[column].dtype != dtype)
+    return diffs
+
+
+# engines whose results don't have the dtypes of the output schema
+UNTYPED = {'reference'}
+
+
+def run(pandag, df, engines=None, baseline='eval'):
+    """Evaluate `df` with each engine and compare them to the baseline.
+
+    Args:
+        pandag (pandag.Pandag): The graph, it isn't modified.
+        df (pandas.DataFrame): The DataFrame to be evaluated.
+        engines (list): Engine names (see ENGINES) or a name -> function
+            mapping, None for all engines.
+        baseline (str): The engine to compare the others to.
+
+    Returns:
+        dict: Engine name -> {'seconds': evaluation time, 'diff':
+        differences to the baseline (see diff_frames) and, for full
+        results, to the output schema (see diff_schema)}.
+
+    """
+    if engines is None:
+        engines = ENGINES
+    elif not isinstance(engines, dict):
+        engines = {name: ENGINES[name] for name in engines}
+    engines = {baseline: ENGINES[baseline], **engines}
+    schema = pandag.output_schema(df.head(1))
+    results = {}
+    expected = None
+    for name, engine in engines.items():
+        start = time.perf_counter()
+        res, columns = engine(pandag, df)
+        seconds = time.perf_counter() - start
+        if expected is None:
+            expected = res
+        diff = diff_frames(expected, res, columns)
+        if columns is None:
+            schema_diff = diff_schema(schema, df, res, dtypes=name not in UNTYPED)
+            if schema_diff:
+                diff = pd.concat([diff, pd.DataFrame(schema_diff, columns=diff.columns)],
+                                 ignore_index=True)
+        results[name] = {'seconds': seconds, 'diff': diff}
+    return results
+
+
+def check(pandag, df, engines=None, baseline='eval', max_rows=10):
+    """Assert that all engines agree with the baseline.
+
+    Args:
+        See `run`, max_rows (int) is the number of differences to show per
+        engine.
+
+    Returns:
+        dict: The results of `run`.
+
+    """
+    results = run(pandag, df, engines=engines, baseline=baseline)
+    failures = [f"{name}: {len(result['diff'])} differences\n"
+                f"{result['diff'].head(max_rows).to_string()}"
+                for name, result in results.items() if len(result['diff'])]
+    assert not failures, '\n'.join(failures)
+    return results
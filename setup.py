@@ -10,7 +10,7 @@ with open('README.rst') as readme_file:
 with open('HISTORY.rst') as history_file:
     history = history_file.read()
 
-requirements = ['Click>=7.0', 'networkx', 'more-itertools', 'numpy', ]
+requirements = ['Click>=7.0', 'networkx', 'more-itertools', 'numpy', 'pandas', ]
 
 setup_requirements = ['pytest-runner', ]
 
@@ -19,15 +19,13 @@ test_requirements = ['pytest>=3', 'pandas', ]
 setup(
     author="NAGY, Attila",
     author_email='nagy.attila@gmail.com',
-    python_requires='>=3.5',
+    python_requires='>=3.7',
     classifiers=[
         'Development Status :: 4 - Beta',
         'Intended Audience :: Developers',
         'License :: OSI Approved :: MIT License',
         'Natural Language :: English',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.5',
-        'Programming Language :: Python :: 3.6',
         'Programming Language :: Python :: 3.7',
         'Programming Language :: Python :: 3.8',
     ],
@@ -0,0 +1,3 @@
+"""pytest configuration."""
+
+pytest_plugins = ['pandag.pytest_plugin']
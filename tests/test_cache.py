@@ -0,0 +1,128 @@
+"""Tests for graph fingerprints and the result cache."""
+import os
+import subprocess
+import sys
+import textwrap
+
+import numpy as np
+import pandas as pd
+
+from pandag import Pandag
+from pandag.cache import ResultCache
+from pandag.nodes import Assert, Dummy, Output
+
+
+def limit_dag(limit):
+    dag = Pandag()
+    dag.load_algo({
+        Assert('x > @limit'): {
+            True: [Output(_label='HIGH', level='"high"'), Dummy('end')],
+            False: Output(_label='LOW', level='"low"'),
+        },
+    }, local_dict={'limit': limit, 'unused': object()})
+    return dag
+
+
+def test_fingerprint():
+    """Test fingerprints depending on the graph's content only."""
+    assert limit_dag(5).fingerprint() == limit_dag(5).fingerprint()
+    assert limit_dag(5).fingerprint() != limit_dag(6).fingerprint()
+    assert limit_dag(5).uuid != limit_dag(5).uuid
+
+
+def test_result_cache(tmp_path):
+    """Test reusing and evicting cached results."""
+    df = pd.DataFrame({'x': np.arange(10), 'other': np.arange(10) * 2})
+    cache = ResultCache(str(tmp_path), max_bytes=1 << 20)
+    expected = limit_dag(5).eval(df)
+
+    res = limit_dag(5).eval(df, cache=cache)
+    pd.testing.assert_frame_equal(res, expected)
+    assert len(os.listdir(tmp_path)) == 1
+
+    # unreferenced columns aren't part of the key
+    cached = limit_dag(5).eval(df.assign(other=0), cache=cache)
+    pd.testing.assert_frame_equal(cached, expected.assign(other=0))
+    assert len(os.listdir(tmp_path)) == 1
+
+    limit_dag(6).eval(df, cache=cache)
+    limit_dag(5).eval(df.assign(x=df['x'] + 1), cache=cache)
+    assert len(os.listdir(tmp_path)) == 3
+
+    cache.max_bytes = 1
+    cache.evict()
+    assert os.listdir(tmp_path) == []
+
+
+def test_global_dict_fingerprint():
+    """Test @ parameters resolved from global_dict being fingerprinted."""
+    def dag(thr):
+        dag = Pandag()
+        dag.load_algo({Assert('x > @thr'): {True: [Output(y='1'), Dummy('end')]}},
+                      global_dict={'thr': thr})
+        return dag
+
+    assert dag(5).fingerprint() == dag(5).fingerprint()
+    assert dag(5).fingerprint() != dag(50).fingerprint()
+
+
+def test_overwritten_input_column(tmp_path):
+    """Test input columns overwritten by the graph being part of the key."""
+    dag = Pandag()
+    dag.load_algo({Assert('x > 0'): {True: [Output(a='0'), Dummy('end')]}})
+    cache = ResultCache(str(tmp_path))
+    df = pd.DataFrame({'x': [0, 1], 'a': [10, 20]})
+    dag.eval(df, cache=cache)
+
+    df['a'] = [99, 20]
+    assert list(dag.eval(df, cache=cache)['a']) == [99, 0]
+
+
+def test_callable_fingerprint(tmp_path):
+    """Test callables being fingerprinted with the values they capture."""
+    def dag(k, default=1):
+        def scale(r, factor=default):
+            return r['x'] * k * factor
+
+        dag = Pandag()
+        dag.load_algo({Assert('x > 0'): {True: [Output(y=scale), Dummy('end')]}})
+        return dag
+
+    assert dag(1).fingerprint() == dag(1).fingerprint()
+    assert dag(1).fingerprint() != dag(2).fingerprint()
+    assert dag(1).fingerprint() != dag(1, default=2).fingerprint()
+
+    df = pd.DataFrame({'x': [1.0, 2.0]})
+    cache = ResultCache(str(tmp_path))
+    dag(1).eval(df, cache=cache)
+    assert list(dag(2).eval(df, cache=cache)['y']) == [2.0, 4.0]
+
+    # callable objects have no stable representation, they aren't cached
+    class Scale:
+        def __call__(self, r):
+            return r['x']
+
+    unstable = Pandag()
+    unstable.load_algo({Assert('x > 0'): {True: [Output(y=Scale()), Dummy('end')]}})
+    assert unstable.fingerprint() is None
+    cache.clear()
+    assert list(unstable.eval(df, cache=cache)['y']) == [1.0, 2.0]
+    assert os.listdir(tmp_path) == []
+
+
+def test_set_parameter_fingerprint():
+    """Test set parameters giving the same fingerprint across processes."""
+    code = textwrap.dedent('''
+        from pandag import Pandag
+        from pandag.nodes import Assert, Dummy, Output
+        dag = Pandag()
+        dag.load_algo({Assert('s in @vals'): {True: [Output(y='1'), Dummy('end')]}},
+                      local_dict={'vals': {'a', 'b', 'c', 'd', 'e'}})
+        print(dag.fingerprint())
+    ''')
+    digests = {
+        subprocess.run([sys.executable, '-c', code], check=True, capture_output=True, text=True,
+                       env=dict(os.environ, PYTHONHASHSEED=str(seed))).stdout
+        for seed in range(4)
+    }
+    assert len(digests) == 1
@@ -0,0 +1,134 @@
+"""Tests for out-of-core evaluation of columnar files."""
+
+import os
+import pytest
+import pandas as pd
+import numpy as np
+
+from pandag import Pandag, routing
+from pandag.nodes import Assert, Dummy, Output
+from tests.test_graphml import get_file
+
+
+@pytest.fixture
+def sample_df():
+    """Sample DataFrame with a column the graph doesn't reference."""
+    size = 100
+    return pd.DataFrame({'x': np.repeat(range(size), size),
+                         'y': list(range(size)) * size,
+                         'unused': np.zeros(size * size)})
+
+
+def test_referenced_columns():
+    """Test finding the columns used by the graph."""
+    dag = Pandag()
+    dag.load_graphml(get_file("box.graphml"), custom_ids=True)
+    assert dag.input_columns(['unused', 'y', 'x']) == ['y', 'x']
+    assert dag.output_columns() == ['color', 'path']
+
+
+def test_eval_npy(tmp_path, sample_df):
+    """Test evaluating a directory of .npy files."""
+    path_in = tmp_path / 'in'
+    path_in.mkdir()
+    for column in sample_df.columns:
+        np.save(path_in / f'{column}.npy', sample_df[column].to_numpy())
+    dag = Pandag()
+    dag.load_graphml(get_file("box.graphml"), custom_ids=True)
+    dag.eval_file(str(path_in), str(tmp_path / 'out'), chunksize=3000)
+
+    assert sorted(os.listdir(tmp_path / 'out')) == ['color.npy', 'path.npy']
+    expected = Pandag()
+    expected.load_graphml(get_file("box.graphml"), custom_ids=True)
+    res = expected.eval(sample_df.copy())
+    color = np.load(tmp_path / 'out' / 'color.npy', mmap_mode='r')
+    path = np.load(tmp_path / 'out' / 'path.npy', mmap_mode='r')
+    assert list(color) == list(res['color'])
+    assert list(path) == list(res['path'])
+
+
+def test_eval_arrow(tmp_path, sample_df):
+    """Test evaluating an Arrow IPC file."""
+    feather = pytest.importorskip('pyarrow.feather')
+    feather.write_feather(sample_df, tmp_path / 'in.arrow', chunksize=4000)
+    dag = Pandag()
+    dag.load_graphml(get_file("box.graphml"), custom_ids=True)
+    dag.eval_file(str(tmp_path / 'in.arrow'), str(tmp_path / 'out.arrow'),
+                  chunksize=3000)
+
+    res = dag.eval(sample_df.copy())
+    out = feather.read_feather(tmp_path / 'out.arrow')
+    assert list(out.columns) == ['color', 'path']
+    assert list(out['color']) == list(res['color'])
+    assert list(out['path']) == list(res['path'])
+
+
+def test_missing_values(tmp_path):
+    """Test storing partially written columns with their types."""
+    feather = pytest.importorskip('pyarrow.feather')
+    df = pd.DataFrame({'x': np.arange(10)})
+    path_in = tmp_path / 'in'
+    path_in.mkdir()
+    np.save(path_in / 'x.npy', df['x'].to_numpy())
+    feather.write_feather(df, tmp_path / 'in.arrow')
+    dag = Pandag()
+    dag.load_algo({
+        Assert('x > 5'): {
+            True: [Output(flag='x > 7', n='x * 2', label='"big"'), Dummy('end')],
+        },
+    })
+    # the first chunk doesn't reach the Output node
+    dag.eval_file(str(path_in), str(tmp_path / 'out'), chunksize=4)
+    dag.eval_file(str(tmp_path / 'in.arrow'), str(tmp_path / 'out.arrow'), chunksize=4)
+
+    flag = np.load(tmp_path / 'out' / 'flag.npy')
+    assert flag.dtype == float
+    assert np.isnan(flag[:6]).all() and list(flag[6:]) == [0, 0, 1, 1]
+    assert list(np.load(tmp_path / 'out' / 'label.npy')) == [''] * 6 + ['big'] * 4
+    out = feather.read_feather(tmp_path / 'out.arrow', columns=['flag', 'n', 'label'])
+    assert out['flag'].tolist()[6:] == [False, False, True, True]
+    assert out['flag'][:6].isna().all()
+    assert out['n'].tolist()[6:] == [12, 14, 16, 18]
+    assert out['label'].tolist() == [None] * 6 + ['big'] * 4
+
+
+def test_overwritten_columns(tmp_path):
+    """Test rows not written keeping the input values of overwritten columns."""
+    feather = pytest.importorskip('pyarrow.feather')
+    df = pd.DataFrame({'x': np.arange(8), 'a': np.arange(8) * 10})
+    path_in = tmp_path / 'in'
+    path_in.mkdir()
+    for column in df.columns:
+        np.save(path_in / f'{column}.npy', df[column].to_numpy())
+    feather.write_feather(df, tmp_path / 'in.arrow')
+    dag = Pandag()
+    dag.load_algo({Assert('x > 5'): {True: [Output(a='0'), Dummy('end')]}})
+    dag.eval_file(str(path_in), str(tmp_path / 'out'), chunksize=3)
+    dag.eval_file(str(tmp_path / 'in.arrow'), str(tmp_path / 'out.arrow'), chunksize=3)
+
+    expected = [0, 10, 20, 30, 40, 50, 0, 0]
+    assert list(dag.eval(df.copy())['a']) == expected
+    assert list(np.load(tmp_path / 'out' / 'a.npy')) == expected
+    assert feather.read_feather(tmp_path / 'out.arrow')['a'].tolist() == expected
+
+
+def test_string_width(tmp_path, sample_df):
+    """Test string columns being sized from the schema up front."""
+    path_in = tmp_path / 'in'
+    path_in.mkdir()
+    for column in sample_df.columns:
+        np.save(path_in / f'{column}.npy', sample_df[column].to_numpy())
+    dag = Pandag()
+    dag.load_graphml(get_file("box.graphml"), custom_ids=True)
+    # the longest path isn't taken by the first chunk
+    dag.eval_file(str(path_in), str(tmp_path / 'out'), chunksize=10)
+
+    compiled = dag.compile()
+    start = compiled.numbering()[0]['start']
+    paths = [compiled.decode_path(i) for i in range(compiled.numbering()[0]['num_paths'][start])]
+    width = max(len(path) for path in paths)
+    assert routing.max_path_length(compiled.components) == width
+    assert np.load(tmp_path / 'out' / 'path.npy').dtype == np.dtype(f'U{width}')
+    categories = dag.output_schema(sample_df.head(1))['color'].categories
+    assert np.load(tmp_path / 'out' / 'color.npy').dtype == np.dtype(
+        f'U{max(len(c) for c in categories)}')
@@ -0,0 +1,46 @@
+"""Differential tests of the evaluation engines."""
+import numpy as np
+import pandas as pd
+
+from pandag import Pandag, testing
+from pandag.graphml import generate_node_id
+
+from .test_graphml import get_file
+
+
+def test_random(differential, pandag_seed):
+    """Test all engines agreeing on random graphs."""
+    differential(testing.random_dag(pandag_seed), testing.random_frame(pandag_seed))
+
+
+def test_box(differential):
+    """Test all engines agreeing on the box example."""
+    df = pd.DataFrame({'x': np.repeat(range(0, 100, 7), 15),
+                       'y': list(range(0, 100, 7)) * 15})
+    dag = Pandag()
+    dag.load_graphml(get_file("box.graphml"), custom_ids=True)
+    differential(dag, df)
+
+
+def test_c4(differential):
+    """Test all engines agreeing on the C4 algo."""
+    def node_id_gen(node, data):
+        node_id, label = generate_node_id(node, data)
+        return int(node_id), label
+
+    dag = Pandag(path_column="dag_path")
+    dag.load_graphml(get_file("c4.graphml"), custom_ids=True,
+                     local_dict={"c4_target": 0.9, "outrigger_target": 1.1,
+                                 "outrigger_min": 1, "num_grace_days": 14},
+                     node_id_func=node_id_gen)
+    df = pd.read_pickle(get_file("c4.df.pickle"))
+    # the reference engine evaluates row by row, a sample is enough
+    differential(dag, df[["target_roas_old", "days_since_last_change"]].iloc[::20])
+
+
+def test_diff_frames():
+    """Test reporting differences row by row."""
+    expected = pd.DataFrame({'a': [1.0, None, 3.0], 'b': ['x', 'y', 'z']})
+    actual = pd.DataFrame({'a': [1, None, 4], 'b': ['x', 'y', 'y']})
+    diff = testing.diff_frames(expected, actual)
+    assert diff.values.tolist() == [[2, 'a', 3.0, 4], [2, 'b', 'z', 'y']]
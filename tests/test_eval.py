@@ -0,0 +1,362 @@
+"""Tests for DAG evaluation."""
+
+import tracemalloc
+
+import pandas as pd
+import numpy as np
+
+from pandag import Pandag, routing
+from pandag.nodes import Assert, Dummy, Inequal, Output, split_assignments
+
+
+def box_algo():
+    """Return the box example algo as a python data structure."""
+    # Output nodes only update rows flowing through them, so they are
+    # followed by an end node
+    end = Dummy('end')
+    red = [Output(_label='RED', color='"red"'), end]
+    black = [Output(_label='BLACK', color='"black"'), end]
+    return {
+        Assert('x >= 60'): {
+            False: {
+                Assert('x < 40'): {
+                    False: {
+                        Assert('y >= 60'): {
+                            False: {
+                                Assert('y < 40'): {
+                                    False: black,
+                                    True: red,
+                                },
+                            },
+                            True: red,
+                        },
+                    },
+                    True: red,
+                },
+            },
+            True: red,
+        }
+    }
+
+
+def test_split_assignments():
+    """Test splitting multi-line expressions into assignments."""
+    expr = 'a = b + 1 # comment\n\nc = "x == y"\nd = @e'
+    assert split_assignments(expr) == [('a', 'b + 1'), ('c', '"x == y"'),
+                                       ('d', '@e')]
+    assert split_assignments('a == b') is None
+
+
+def test_categorical_output():
+    """Test constant string outputs being stored as categoricals."""
+    df = pd.DataFrame({'x': np.repeat(range(100), 100),
+                       'y': list(range(100)) * 100})
+    dag = Pandag()
+    dag.load_algo(box_algo())
+    res = dag.eval(df)
+
+    assert isinstance(res['color'].dtype, pd.CategoricalDtype)
+    assert set(res['color'].cat.categories) == {'red', 'black'}
+    assert all(res.query('x >= 60')['color'] == 'red')
+    assert all(res.query('40 <= x < 60 and 40 <= y < 60')['color'] == 'black')
+
+
+def test_dependent_assignments():
+    """Test multi-line expressions referring to earlier assignments."""
+    df = pd.DataFrame({'a': [1, 2, 3]})
+    dag = Pandag()
+    dag.load_algo({Output(expr='b = a * 2\nc = b + 1'): Dummy('end')})
+    res = dag.eval(df)
+
+    assert list(res['b']) == [2, 4, 6]
+    assert list(res['c']) == [3, 5, 7]
+
+
+def test_overwritten_values_read():
+    """Test values read from a column keeping them when it's overwritten."""
+    df = pd.DataFrame({'x': [1, 2, 3]})
+    dag = Pandag()
+    dag.load_algo({Assert('x > 0'): {
+        True: [Output(a='x * 2'), Output(expr='b = a\na = 0\nc = b'), Dummy('end')],
+    }})
+    res = dag.eval(df)
+
+    assert list(res['a']) == [0, 0, 0]
+    assert list(res['b']) == [2, 4, 6]
+    assert list(res['c']) == [2, 4, 6]
+
+
+def test_output_memory():
+    """Test Output nodes' values not being kept until the end."""
+    df = pd.DataFrame({'x': np.arange(100_000, dtype=float)})
+    dag = Pandag(path_column=None)
+    dag.load_algo({Assert('x >= 0'): {
+        True: [Output(score=f'x * {i}') for i in range(40)] + [Dummy('end')],
+    }})
+    dag.compile()
+    tracemalloc.start()
+    try:
+        res = dag.eval(df)
+        peak = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+    assert list(res['score'][:3]) == [0, 39, 78]
+    assert peak < 12 * df['x'].nbytes
+
+
+def test_multiple_start_nodes():
+    """Test evaluating components in start node order."""
+    df = pd.DataFrame({'a': [1, 2, 3, 4]})
+    dag = Pandag()
+    dag.load_algo({
+        Assert('a > 2', _id='s1'): {
+            True: [Output(_id='big', size='"big"'), Dummy(_id='e1')],
+            False: [Output(_id='small', size='"small"'), Dummy(_id='e2')],
+        },
+    })
+    dag.load_algo({
+        Assert('a % 2 == 0', _id='s2'): {
+            True: [Output(_id='even', parity='"even"'), Dummy(_id='e3')],
+            False: Dummy(_id='e4'),
+        },
+    })
+    assert [start for start, _ in dag.components()] == ['s1', 's2']
+    res = dag.eval(df)
+
+    assert list(res['size']) == ['small', 'small', 'big', 'big']
+    assert list(res['parity'].astype(object).fillna('')) == ['', 'even', '', 'even']
+    assert list(res['path']) == ['s1,small,e2,s2,e4',
+                                 's1,small,e2,s2,even,e3',
+                                 's1,big,e1,s2,e4',
+                                 's1,big,e1,s2,even,e3']
+
+
+def test_optimize():
+    """Test the optimised graph giving the same results."""
+    def algo():
+        end = Dummy(_id='end')
+        return {
+            Dummy(_id='start'): {
+                Dummy(_id='pass'): {
+                    Assert('@use_limit', _id='const'): {
+                        True: {
+                            Assert('a > @limit', _id='limit'): {
+                                True: [Output(_id='o1', expr='b = a * 2'),
+                                       Output(_id='o2', expr='c = b + 1'),
+                                       Output(_id='o3', label='"high"'), end],
+                                False: [Output(_id='o4', label='"low"'), end],
+                            },
+                        },
+                        False: [Output(_id='unused', label='"none"'), end],
+                    },
+                },
+            },
+        }
+
+    df = pd.DataFrame({'a': range(10)})
+    params = {'use_limit': True, 'limit': 4}
+    expected = Pandag()
+    expected.load_algo(algo(), local_dict=params)
+    dag = Pandag()
+    dag.load_algo(algo(), local_dict=params)
+    dag.optimize()
+
+    assert set(dag.plan.nodes) == {'start', 'limit', 'o1', 'o4', 'end'}
+    assert set(dag.G.nodes) == set(expected.G.nodes)
+    pd.testing.assert_frame_equal(dag.eval(df), expected.eval(df))
+    assert dag.eval(df)['path'][9] == 'start,pass,const,limit,o1,o2,o3,end'
+
+
+def test_output_dtypes():
+    """Test buffered outputs getting the schema's dtypes."""
+    df = pd.DataFrame({'a': [1, 2, 3]})
+    end = Dummy('end')
+    dag = Pandag()
+    dag.load_algo({
+        Assert('a > 1'): {
+            True: [Output(expr='b = a\nflag = a > 2'), end],
+            False: [Output(expr='a = a * 0.5'), end],
+        },
+    })
+    res = dag.eval(df)
+
+    assert df['a'].dtype == np.int64
+    assert list(df['a']) == [1, 2, 3]
+    assert res['a'].dtype == np.float64
+    assert list(res['a']) == [0.5, 2, 3]
+    assert res['b'].dtype == np.float64
+    assert res['b'].isna().tolist() == [True, False, False]
+    assert res['flag'].dtype == object
+    assert list(res['flag'][1:]) == [False, True]
+
+
+def test_route():
+    """Test routing rows without applying the outputs."""
+    df = pd.DataFrame({'a': range(6)})
+    dag = Pandag()
+    dag.load_algo({
+        Output(_id='double', expr='b = a * 2'): {
+            Assert('b > 4', _id='big'): {
+                True: [Output(_id='label', label='"big"'), Dummy(_id='end1')],
+                False: Dummy(_id='end2'),
+            },
+        },
+    })
+    assert routing.needed_outputs(dag.compile().components) == {'double'}
+    for optimize in (False, True):
+        if optimize:
+            dag.optimize()
+        terminals, path_ids = dag.route(df, path_ids=True)
+        res = dag.eval(df)
+
+        assert list(terminals) == ['end2'] * 3 + ['end1'] * 3
+        assert terminals.codes.dtype.itemsize == 1
+        assert path_ids.dtype.itemsize == 1
+        assert [dag.decode_path(i) for i in path_ids] == list(res['path'])
+
+
+def test_profile():
+    """Test ordering conditions by the profiled branch hits."""
+    df = pd.DataFrame({'x': range(100)})
+    end = Dummy(_id='end')
+    dag = Pandag()
+    dag.load_algo({
+        Inequal(_id='split'): {
+            'x < 10': [Output(_id='small', size='"small"'), end],
+            'x >= 10 and x < 20': [Output(_id='medium', size='"medium"'), end],
+            'x >= 20': [Output(_id='large', size='"large"'), end],
+        },
+        Inequal(_id='overlap'): {
+            'x < 50': Dummy(_id='low'),
+            'x < 80': Dummy(_id='mid'),
+        },
+    })
+    expected = dag.eval(df)
+
+    assert set(expected['size']) == {'small', 'medium', 'large'}
+
+    hits = dag.profile(df, detect_exclusive=True)
+    assert hits[('split', 'large')] == 80
+    assert dag.G.edges['overlap', 'low']['hits'] == 50
+    assert dag.G.edges['overlap', 'mid']['hits'] == 30
+    assert dag.get_node('split').exclusive
+    assert not dag.get_node('overlap').exclusive
+
+    steps = {node_id: edges for _, component in dag.compile().components
+             for node_id, _, edges in component}
+    assert [dst for dst, _ in steps['split']] == ['large', 'small', 'medium']
+    assert [dst for dst, _ in steps['overlap']] == ['low', 'mid']
+    pd.testing.assert_frame_equal(dag.eval(df), expected)
+
+
+def test_unreached_output():
+    """Test columns of Output nodes no row reaches being created."""
+    df = pd.DataFrame({'x': range(6, 10)})
+    dag = Pandag()
+    dag.load_algo({
+        Assert('x > 5'): {
+            True: [Output(a='1.5'), Dummy('end1')],
+            False: [Output(b='"lbl"'), Dummy('end2')],
+        },
+    })
+    res = dag.eval(df)
+
+    assert list(res.columns) == ['x', 'a', 'b', 'path']
+    assert res['b'].isna().all()
+    assert isinstance(res['b'].dtype, pd.CategoricalDtype)
+
+
+def test_cross_row_condition():
+    """Test conditions reading other rows seeing the whole frame."""
+    df = pd.DataFrame({'x': range(10)})
+    dag = Pandag()
+    dag.load_algo({
+        Assert('x < 2'): {
+            True: {
+                Assert('x > x.mean()'): {
+                    True: [Output(size='"hi"'), Dummy('end')],
+                    False: [Output(size='"lo"'), Dummy('end2')],
+                },
+            },
+        },
+    }, local_dict={'ragged': [[1], [2, 3]]})
+    res = dag.eval(df)
+
+    # the mean is taken over all rows, not just the ones at the node
+    assert list(res['size'][:2]) == ['lo', 'lo']
+
+
+def test_grid_index():
+    """Test grid variants seeing the original index."""
+    df = pd.DataFrame({'x': range(4)}, index=range(10, 14))
+    dag = Pandag()
+    dag.load_algo({
+        Assert('index > @k'): {
+            True: [Output(size='"hi"'), Dummy('end')],
+            False: [Output(size='"lo"'), Dummy('end2')],
+        },
+    }, local_dict={'k': 2})
+    res = dag.eval_grid(df, {'low': {}, 'high': {'k': 12}})
+
+    assert list(res['low']['size']) == ['hi'] * 4
+    assert list(res['high']['size']) == ['lo'] * 3 + ['hi']
+    assert dag.eval_grid(df, []) == {}
+
+
+def test_grid_params():
+    """Test grid variants with list parameters and string outputs."""
+    df = pd.DataFrame({'s': list('abcd')})
+    dag = Pandag()
+    dag.load_algo({
+        Assert('s in @vals'): {
+            True: {Output(lbl='@name'): Dummy('end')},
+        },
+    }, local_dict={'vals': ['a'], 'name': 'x'})
+    param_sets = {'base': {}, 'ac': {'vals': ['a', 'c'], 'name': 'y'}}
+    res = dag.eval_grid(df, param_sets)
+
+    assert res['base']['lbl'].tolist()[:1] == ['x']
+    assert res['ac']['lbl'].tolist()[::2] == ['y', 'y']
+    for key, params in param_sets.items():
+        expected = Pandag()
+        expected.load_algo({
+            Assert('s in @vals'): {
+                True: {Output(lbl='@name'): Dummy('end')},
+            },
+        }, local_dict={'vals': ['a'], 'name': 'x', **params})
+        pd.testing.assert_frame_equal(res[key], expected.eval(df))
+        assert isinstance(res[key]['lbl'].dtype, pd.CategoricalDtype)
+
+
+def test_callable_reads_written_columns():
+    """Test callable outputs seeing the columns written upstream."""
+    df = pd.DataFrame({'x': [1, 2], 'n': pd.array([1, None], dtype='Int64')})
+    dag = Pandag()
+    dag.load_algo({
+        Output(expr='a = x * 2\nm = n + 1'): {Output(b=lambda r: r['a'] + 1): Dummy('end')},
+    })
+    res = dag.eval(df)
+
+    assert list(res['b']) == [3, 5]
+    assert res['m'].dtype == 'Int64'
+
+
+def test_route_skips_outputs():
+    """Test route not evaluating Output nodes conditions don't read."""
+    def fail(row):
+        raise AssertionError("evaluated")
+
+    df = pd.DataFrame({'a': range(6)})
+    dag = Pandag()
+    dag.load_algo({
+        Assert('a > 2', _id='big'): {
+            True: {Output(_id='label', label=fail): Dummy(_id='end1')},
+            False: Dummy(_id='end2'),
+        },
+    })
+    terminals, path_ids = dag.route(df, path_ids=True)
+
+    assert list(terminals) == ['end2'] * 3 + ['end1'] * 3
+    assert dag.compile().numbering() is dag.compile().numbering()
+    assert dag.decode_path(path_ids[-1]) == 'big,label,end1'
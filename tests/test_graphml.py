@@ -82,10 +82,13 @@ def test_labels():
     assert dag.G.get_edge_data("2", "3").get("label") is False
 
 
-def test_eval(sample_df):
+@pytest.mark.parametrize("optimize", [False, True])
+def test_eval(sample_df, optimize):
     """Test eval and its results."""
     dag = Pandag()
     dag.load_graphml(get_file("box.graphml"), custom_ids=True)
+    if optimize:
+        dag.optimize()
     res = dag.eval(sample_df)
 
     query = "x>=60"
@@ -109,7 +112,8 @@ def test_eval(sample_df):
     assert all(res.query(query)["path"] == "0,1,2,3,4,5,7")
 
 
-def test_c4():
+@pytest.mark.parametrize("optimize", [False, True])
+def test_c4(optimize):
     """Test C4 algo."""
     def node_id_gen(node, data):
         """Convert string node IDs to int."""
@@ -126,6 +130,8 @@ def test_c4():
                      custom_ids=True,
                      local_dict=locals(),
                      node_id_func=node_id_gen)
+    if optimize:
+        dag.optimize()
     df = pd.read_pickle(get_file("c4.df.pickle"))
     df = df[["target_roas_old", "days_since_last_change"]]
     res = dag.eval(df)
@@ -142,3 +148,38 @@ def test_c4():
             assert row.target_roas_rec == row.target_roas_old, f"index: {idx} failed" # n7
         else:
             assert row.target_roas_rec == row.target_roas_target, f"index: {idx} failed"  # n5
+
+
+def test_c4_grid():
+    """Test evaluating C4 algo variants at once."""
+    def node_id_gen(node, data):
+        """Convert string node IDs to int."""
+        node_id, label = generate_node_id(node, data)
+        return int(node_id), label
+
+    params = {
+        "c4_target": 0.9,
+        "outrigger_target": 1.1,
+        "outrigger_min": 1,
+        "num_grace_days": 14,
+    }
+    param_sets = {
+        "base": {},
+        "short_grace": {"num_grace_days": 3},
+        "low_target": {"c4_target": 0.5, "outrigger_min": 0.7},
+    }
+    df = pd.read_pickle(get_file("c4.df.pickle"))
+    df = df[["target_roas_old", "days_since_last_change"]]
+
+    dag = Pandag(path_column="dag_path")
+    dag.load_graphml(get_file("c4.graphml"), custom_ids=True,
+                     local_dict=params, node_id_func=node_id_gen)
+    res = dag.eval_grid(df, param_sets)
+
+    assert list(res) == list(param_sets)
+    for key, variant_params in param_sets.items():
+        expected = Pandag(path_column="dag_path")
+        expected.load_graphml(get_file("c4.graphml"), custom_ids=True,
+                              local_dict={**params, **variant_params},
+                              node_id_func=node_id_gen)
+        pd.testing.assert_frame_equal(res[key], expected.eval(df))
@@ -0,0 +1,54 @@
+"""Tests for partitioned (Dask) evaluation."""
+
+import pytest
+import pandas as pd
+import numpy as np
+
+from pandag import Pandag
+from tests.test_eval import box_algo
+from tests.test_graphml import get_file
+
+dd = pytest.importorskip('dask.dataframe')
+
+
+@pytest.fixture
+def sample_df():
+    """Sample DataFrame."""
+    size = 100
+    return pd.DataFrame({'x': np.repeat(range(size), size),
+                         'y': list(range(size)) * size})
+
+
+def test_output_schema(sample_df):
+    """Test deriving the output schema from the Output nodes."""
+    dag = Pandag()
+    dag.load_graphml(get_file("box.graphml"), custom_ids=True)
+    schema = dag.output_schema(sample_df.head(1))
+    assert list(schema) == ['color', 'path']
+    assert set(schema['color'].categories) == {'red', 'black'}
+    assert schema['path'] == object
+
+
+def test_eval_does_not_modify_input(sample_df):
+    """Test the input frame being left alone."""
+    orig = sample_df.copy()
+    dag = Pandag()
+    dag.load_graphml(get_file("box.graphml"), custom_ids=True)
+    dag.eval(sample_df)
+    pd.testing.assert_frame_equal(sample_df, orig)
+
+
+@pytest.mark.parametrize('scheduler', ['threads', 'processes'])
+def test_map_partitions(sample_df, scheduler):
+    """Test evaluating a partitioned frame with local schedulers."""
+    dag = Pandag()
+    dag.load_algo(box_algo())
+    ddf = dd.from_pandas(sample_df, npartitions=4)
+    res = dag.map_partitions(ddf)
+
+    assert list(res.columns) == ['x', 'y', 'color', 'path']
+    computed = res.compute(scheduler=scheduler)
+    expected = dag.eval(sample_df)
+    pd.testing.assert_frame_equal(computed, expected[list(computed.columns)],
+                                  check_categorical=False)
+    assert computed.dtypes.equals(res._meta.dtypes)
@@ -0,0 +1,39 @@
+"""Tests for plotting utilities."""
+
+import matplotlib
+matplotlib.use('Agg')
+
+from pandag import Pandag, plot
+from tests.test_eval import box_algo
+from tests.test_graphml import get_file
+
+
+def test_coordinates_layout():
+    """Test using the GraphML coordinates."""
+    dag = Pandag()
+    dag.load_graphml(get_file("box.graphml"), custom_ids=True)
+    pos = plot._layout(dag.G, 'auto')
+    assert pos['0'] == (161.43015873015872, -0.0)
+    assert set(pos) == set(dag.G.nodes)
+
+
+def test_layered_layout():
+    """Test the in-process layered layout and its cache."""
+    dag = Pandag()
+    dag.load_algo(box_algo())
+    pos = plot._layout(dag.G, 'layered')
+    assert set(pos) == set(dag.G.nodes)
+    start, = dag.start_nodes()
+    end, = dag.end_nodes()
+    assert pos[start][1] == 0
+    assert pos[end][1] < min(y for ix, (x, y) in pos.items() if ix != end)
+    assert plot._layout(dag.G, 'layered') is plot._layout(dag.G, 'layered')
+
+
+def test_plot_dag(tmp_path):
+    """Test drawing the graph without graphviz."""
+    dag = Pandag()
+    dag.load_algo(box_algo())
+    fpath = tmp_path / 'dag.png'
+    dag.draw(fpath=str(fpath), layout='layered', show_ids=True)
+    assert fpath.stat().st_size > 0
@@ -0,0 +1,74 @@
+"""Tests for the compiled graph runtime."""
+
+import subprocess
+import sys
+import textwrap
+
+import pandas as pd
+import numpy as np
+
+from pandag import Pandag
+from pandag.runtime import load
+from tests.test_graphml import get_file
+
+
+def run_python(code):
+    """Run `code` in a fresh interpreter and return its output."""
+    return subprocess.run([sys.executable, '-c', textwrap.dedent(code)],
+                          check=True, capture_output=True, text=True).stdout
+
+
+def test_import_is_lazy():
+    """Test importing pandag without networkx and matplotlib."""
+    out = run_python('''
+        import sys
+        import pandag
+        print('networkx' in sys.modules, 'matplotlib' in sys.modules)
+        pandag.Pandag
+        print('networkx' in sys.modules, 'matplotlib' in sys.modules)
+    ''')
+    assert out.split() == ['False', 'False', 'True', 'False']
+
+
+def test_compiled_eval(tmp_path):
+    """Test evaluating a saved compiled graph without networkx."""
+    df = pd.DataFrame({'x': np.repeat(range(100), 100),
+                       'y': list(range(100)) * 100})
+    df.to_pickle(tmp_path / 'df.pickle')
+    dag = Pandag()
+    dag.load_graphml(get_file("box.graphml"), custom_ids=True)
+    dag.optimize()
+    dag.compile().save(tmp_path / 'dag.pickle')
+    dag.eval(df).to_pickle(tmp_path / 'expected.pickle')
+
+    out = run_python(f'''
+        import sys
+        import pandas as pd
+        from pandag.runtime import load
+        dag = load({str(tmp_path / 'dag.pickle')!r})
+        df = pd.read_pickle({str(tmp_path / 'df.pickle')!r})
+        res = dag.eval(df)
+        pd.testing.assert_frame_equal(res, pd.read_pickle({str(tmp_path / 'expected.pickle')!r}))
+        print('networkx' in sys.modules, 'matplotlib' in sys.modules)
+    ''')
+    assert out.split() == ['False', 'False']
+    compiled = load(tmp_path / 'dag.pickle')
+    assert list(compiled.route(df)) == list(dag.route(df))
+
+
+def test_compile_is_cached():
+    """Test reusing the compiled graph until the graph changes."""
+    df = pd.DataFrame({'x': np.repeat(range(100), 10), 'y': list(range(10)) * 100})
+    dag = Pandag()
+    dag.load_graphml(get_file("box.graphml"), custom_ids=True)
+    compiled = dag.compile()
+    assert dag.compile() is compiled
+
+    dag.profile(df)
+    assert dag.compile() is not compiled
+    compiled = dag.compile()
+    dag.optimize()
+    assert dag.compile() is not compiled
+    compiled = dag.compile()
+    dag.invalidate()
+    assert dag.compile() is not compiled